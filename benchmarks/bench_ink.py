@@ -0,0 +1,46 @@
+"""Time PNGtoSVG.ink against the per-pixel loop it replaced, at the v3 tracing size.
+
+    python -m benchmarks.bench_ink
+"""
+import timeit
+
+import numpy as np
+from PIL import Image
+
+from handwrite.binarize import trace_threshold
+from handwrite.layouts import sheet_layout
+from handwrite.pngtosvg import PNGtoSVG
+
+metadata = {"sheetversion": "3.0.0"}
+glyph_width, glyph_height = sheet_layout(metadata["sheetversion"])["trace_size"]
+cell = Image.fromarray(
+    np.random.default_rng(0).integers(
+        0, 256, (glyph_height, glyph_width), dtype=np.uint8
+    )
+)
+threshold = trace_threshold(metadata)
+converter = PNGtoSVG()
+
+
+def loop():
+    gray = cell.resize((glyph_width, glyph_height), resample=Image.Resampling.BICUBIC)
+    data = []
+    for pix in list(gray.getdata()):
+        if pix >= threshold:
+            data.append(False)
+        else:
+            data.append(True)
+    return np.array(data, dtype=bool).reshape(glyph_height, glyph_width)
+
+
+def array():
+    return converter.ink(cell, metadata)
+
+
+assert (loop() == array()).all()
+for fn in (loop, array):
+    number = 20
+    seconds = min(timeit.repeat(fn, number=number, repeat=3)) / number
+    print(
+        f"{fn.__name__:6} {seconds*1000:8.3f} ms per glyph, {seconds*278:6.2f} s per 278 glyphs"
+    )
@@ -0,0 +1,61 @@
+"""Trace the glyphs of a test sheet at the fixed trace size and with --trace-resolution adaptive,
+and compare time, number of curves, and how close the adaptive outlines are to the fixed ones.
+
+    python -m benchmarks.bench_trace_resolution
+"""
+import collections
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from handwrite import SHEETtoPNG
+from handwrite.atlas import GlyphDirectory
+from handwrite.layouts import sheet_layout
+from handwrite.pngtosvg import PNGtoSVG
+from handwrite.tracers import rasterize, shape_similarity
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sheet = os.path.join(
+    root, "tests", "test_data", "sheettopng", "sitelen-pona-pi-jan-Watesa.png"
+)
+tracer = "potrace" if shutil.which("potrace") else "opencv"
+metadata = {"sheetversion": "2.1", "debug": "off", "jobs": 1, "tracer": tracer}
+
+directory = tempfile.mkdtemp()
+try:
+    SHEETtoPNG().convert(
+        sheet,
+        directory,
+        os.path.join(root, "handwrite", "default.json"),
+        dict(metadata),
+    )
+    store = GlyphDirectory(directory)
+    cells = [Image.fromarray(store.read(name)) for name in store.names()]
+finally:
+    shutil.rmtree(directory)
+
+width, height = sheet_layout(metadata["sheetversion"])["trace_size"]
+converter = PNGtoSVG()
+filled = {}
+for mode in ("fixed", "adaptive"):
+    resolution = {**metadata, "trace_resolution": mode}
+    inks = [converter.ink(cell, resolution) for cell in cells]
+    start = time.perf_counter()
+    svgs = converter.trace_all(inks, ["glyph"] * len(inks), resolution)
+    seconds = time.perf_counter() - start
+    filled[mode] = [rasterize(svg, (height, width)) for svg in svgs]
+    sizes = collections.Counter(f"{ink.shape[1]}x{ink.shape[0]}" for ink in inks)
+    print(
+        f"\n{mode:8} {tracer}: {seconds:.2f} s, {sum(svg.count(b'C') + svg.count(b'c') for svg in svgs)} curves, sizes {dict(sizes)}"
+    )
+
+similarity = [
+    shape_similarity(a, b) for a, b in zip(filled["fixed"], filled["adaptive"])
+]
+print(
+    f"adaptive vs fixed: mean {np.mean(similarity):.4f}, min {np.min(similarity):.4f}"
+)
@@ -0,0 +1,62 @@
+"""Time each tracer on the glyphs of a test sheet, and how close its outlines are to the bitmaps,
+and to potrace's, if potrace is installed.
+
+    python -m benchmarks.bench_tracers
+"""
+import os
+import shutil
+import tempfile
+import time
+
+import numpy as np
+from PIL import Image
+
+from handwrite import SHEETtoPNG
+from handwrite.atlas import GlyphDirectory
+from handwrite.pngtosvg import PNGtoSVG
+from handwrite.tracers import TRACERS, rasterize, shape_similarity
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sheet = os.path.join(
+    root, "tests", "test_data", "sheettopng", "sitelen-pona-pi-jan-Watesa.png"
+)
+metadata = {"sheetversion": "2.1", "debug": "off"}
+
+directory = tempfile.mkdtemp()
+try:
+    SHEETtoPNG().convert(
+        sheet,
+        directory,
+        os.path.join(root, "handwrite", "default.json"),
+        dict(metadata),
+    )
+    store = GlyphDirectory(directory)
+    inks = [
+        PNGtoSVG().ink(Image.fromarray(store.read(name)), metadata)
+        for name in store.names()
+    ]
+finally:
+    shutil.rmtree(directory)
+
+filled = {}
+for name, tracer_class in TRACERS.items():
+    if name == "potrace" and shutil.which("potrace") is None:
+        print("potrace  not installed")
+        continue
+    tracer = tracer_class()
+    start = time.perf_counter()
+    svgs = [tracer.trace([ink])[0] for ink in inks]
+    seconds = (time.perf_counter() - start) / len(inks)
+    filled[name] = [rasterize(svg, ink.shape) for svg, ink in zip(svgs, inks)]
+    similarity = [shape_similarity(a, ink) for a, ink in zip(filled[name], inks)]
+    print(
+        f"{name:8} {seconds*1000:7.2f} ms per glyph, similarity to the bitmap: mean {np.mean(similarity):.4f}, min {np.min(similarity):.4f}"
+    )
+
+if len(filled) == 2:
+    similarity = [
+        shape_similarity(a, b) for a, b in zip(filled["potrace"], filled["opencv"])
+    ]
+    print(
+        f"opencv vs potrace: mean {np.mean(similarity):.4f}, min {np.min(similarity):.4f}"
+    )
@@ -0,0 +1,270 @@
+import os
+import json
+import mmap
+import struct
+
+# One file per run, instead of a directory per glyph with a PNG, a BMP and an SVG in it.
+#
+#   8 bytes   ATLAS_MAGIC
+#   8 bytes   offset of the index, little endian
+#   8 bytes   length of the index
+#   ...       entries, each one starting on a multiple of 8 bytes
+#   ...       the index, as UTF-8 JSON: {kind: {name: {"offset": ..., "length": ..., "shape": ...}}}
+#
+# Kinds of entries:
+#   "cell"    grayscale cell from SHEETtoPNG, 8 bits per pixel, shape is (height, width)
+#   "bitmap"  thresholded glyph from PNGtoSVG, 1 bit per pixel with 1 for ink, from numpy.packbits
+#   "svg"     traced outline from potrace, as UTF-8 text
+#
+# Each stage appends its entries and a new index to the end of the file, and points the header
+# at the new index, so nothing that was already written moves.
+#
+# Only the standard library is imported up here, so that FontForge's Python can read SVGs
+# out of an atlas in svgtottf.py. numpy is imported when cells and bitmaps are read or written.
+ATLAS_NAME = "glyphs.atlas"
+ATLAS_MAGIC = b"HWATLAS1"
+HEADER = struct.Struct("<8sQQ")
+KINDS = ("cell", "bitmap", "svg")
+
+
+def bitmap_image(ink):
+    """The BMP that potrace traces: black and opaque for ink, white and transparent for paper."""
+    import numpy as np
+    from PIL import Image
+
+    pixels = np.where(
+        ink[:, :, np.newaxis], np.uint8([0, 0, 0, 1]), np.uint8([255, 255, 255, 0])
+    )
+    return Image.fromarray(pixels, "RGBA")
+
+
+class GlyphAtlas:
+    """Every glyph of a run in one memory-mapped file. See the top of atlas.py for the format.
+
+    Written entries are kept in memory until `flush` or `close`, then appended together.
+    Reads are copied out of the memory map, so nothing holds on to it, and `flush` can close it
+    before it grows the file. Windows won't change a file while it's mapped. Cells are read-only.
+
+    Parameters
+    ----------
+    path : str
+        Path to the atlas file.
+    new : bool, default=False
+        Start an empty atlas, even if there's one at `path` from an earlier run.
+    """
+
+    def __init__(self, path, new=False):
+        self.path = path
+        self.index = {kind: {} for kind in KINDS}
+        self.pending = {kind: {} for kind in KINDS}
+        self.mmap = None
+        if new and os.path.exists(path):
+            os.remove(path)
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                magic, index_offset, index_length = HEADER.unpack(f.read(HEADER.size))
+                if magic != ATLAS_MAGIC:
+                    raise ValueError(f"{path} isn't a glyph atlas.")
+                self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            self.index.update(
+                json.loads(
+                    self.mmap[index_offset : index_offset + index_length].decode(
+                        "utf-8"
+                    )
+                )
+            )
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def names(self, kind="cell"):
+        """Names of the glyphs that have an entry of this kind, in the order they were written."""
+        return list({**self.index[kind], **self.pending[kind]})
+
+    def __contains__(self, name_kind):
+        name, kind = name_kind
+        return name in self.pending[kind] or name in self.index[kind]
+
+    def read(self, name, kind="cell"):
+        """Read an entry: a uint8 array for a cell, a bool array for a bitmap, bytes for an SVG."""
+        if name in self.pending[kind]:
+            data, shape = self.pending[kind][name]
+        else:
+            entry = self.index[kind][name]
+            data = self.mmap[entry["offset"] : entry["offset"] + entry["length"]]
+            shape = entry["shape"]
+        if kind == "svg":
+            return bytes(data)
+
+        import numpy as np
+
+        array = np.frombuffer(data, dtype=np.uint8)
+        if kind == "bitmap":
+            return (
+                np.unpackbits(array, count=shape[0] * shape[1])
+                .reshape(shape)
+                .astype(bool)
+            )
+        return array.reshape(shape)
+
+    def write(self, name, kind, value):
+        """Write an entry, replacing any earlier one with the same name and kind.
+
+        `value` is a 2D uint8 array for a cell, a 2D bool array for a bitmap,
+        and str or bytes for an SVG.
+        """
+        self.put(name, kind, self.encode(kind, value))
+
+    def encode(self, kind, value):
+        """The part of `write` that doesn't touch the atlas, so it can run on other threads."""
+        if kind == "svg":
+            return (
+                value.encode("utf-8") if isinstance(value, str) else bytes(value),
+                None,
+            )
+
+        import numpy as np
+
+        if kind == "bitmap":
+            return np.packbits(np.asarray(value, dtype=bool)).tobytes(), list(
+                value.shape
+            )
+        return np.ascontiguousarray(value, dtype=np.uint8).tobytes(), list(value.shape)
+
+    def put(self, name, kind, encoded):
+        """The rest of `write`, with what `encode` returned."""
+        self.pending[kind][name] = encoded
+
+    def flush(self):
+        """Append the entries written since the last flush, and a new index."""
+        if not any(self.pending.values()):
+            return
+        new = not os.path.exists(self.path)
+        self.unmap()
+        with open(self.path, "w+b" if new else "r+b") as f:
+            if new:
+                f.write(HEADER.pack(ATLAS_MAGIC, 0, 0))
+            f.seek(0, os.SEEK_END)
+            for kind in KINDS:
+                for name, (data, shape) in self.pending[kind].items():
+                    f.write(b"\0" * (-f.tell() % 8))
+                    self.index[kind][name] = {
+                        "offset": f.tell(),
+                        "length": len(data),
+                        "shape": shape,
+                    }
+                    f.write(data)
+            index = json.dumps(self.index).encode("utf-8")
+            index_offset = f.tell()
+            f.write(index)
+            f.seek(0)
+            f.write(HEADER.pack(ATLAS_MAGIC, index_offset, len(index)))
+            f.flush()
+            self.mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.pending = {kind: {} for kind in KINDS}
+
+    def unmap(self):
+        if self.mmap is not None:
+            self.mmap.close()
+            self.mmap = None
+
+    def close(self):
+        """Flush, and let go of the file, so the next stage can append to it."""
+        self.flush()
+        self.unmap()
+
+
+class GlyphDirectory:
+    """The original layout: a directory per glyph, with name.png, name.bmp and name.svg in it.
+    PNGtoSVG only writes name.bmp when the debug level is "full".
+
+    Same interface as GlyphAtlas, and every write goes straight to its file.
+    """
+
+    EXTENSIONS = {"cell": ".png", "bitmap": ".bmp", "svg": ".svg"}
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def path(self, name, kind="cell"):
+        return os.path.join(self.directory, name, name + self.EXTENSIONS[kind])
+
+    def names(self, kind="cell"):
+        return [
+            name
+            for name in sorted(os.listdir(self.directory))
+            if os.path.isfile(self.path(name, kind))
+        ]
+
+    def __contains__(self, name_kind):
+        return os.path.isfile(self.path(*name_kind))
+
+    def read(self, name, kind="cell"):
+        if kind == "svg":
+            with open(self.path(name, kind), "rb") as f:
+                return f.read()
+
+        import numpy as np
+        from PIL import Image
+
+        with Image.open(self.path(name, kind)) as image:
+            if kind == "bitmap":
+                # BMPs don't keep the alpha, but ink is black
+                return np.asarray(image.convert("L")) < 128
+            return np.asarray(image.convert("L"))
+
+    def write(self, name, kind, value):
+        self.put(name, kind, self.encode(kind, value))
+
+    def encode(self, kind, value):
+        """The file contents, without writing them yet."""
+        if kind == "svg":
+            return value.encode("utf-8") if isinstance(value, str) else bytes(value)
+        if kind == "bitmap":
+            import io
+
+            buffer = io.BytesIO()
+            bitmap_image(value).save(buffer, format="BMP")
+            return buffer.getvalue()
+
+        import cv2
+
+        # same bytes as cv2.imwrite
+        return cv2.imencode(".png", value)[1].tobytes()
+
+    def put(self, name, kind, encoded):
+        os.makedirs(os.path.join(self.directory, name), exist_ok=True)
+        with open(self.path(name, kind), "wb") as f:
+            f.write(encoded)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        pass
+
+
+def glyph_store(directory, metadata, new=False):
+    """GlyphAtlas in `directory` if metadata["atlas"] is set, otherwise GlyphDirectory.
+
+    Parameters
+    ----------
+    directory : str
+        The characters directory, shared by all stages.
+    metadata : dict
+        Dictionary containing the metadata. Only "atlas" is used.
+    new : bool, default=False
+        Start an empty atlas. SHEETtoPNG does, the later stages add to it.
+    """
+    if metadata.get("atlas"):
+        return GlyphAtlas(os.path.join(directory, ATLAS_NAME), new=new)
+    return GlyphDirectory(directory)
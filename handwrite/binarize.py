@@ -0,0 +1,55 @@
+import cv2
+from packaging.version import Version
+
+
+def binarize(image, threshold_value):
+    """Convert a sheet to the grayscale buffer and ink mask shared by every stage.
+
+    The sheet is converted and thresholded once. Row detection and cell centering
+    read slices of the ink mask, and cells are cropped from the grayscale buffer,
+    so nothing downstream has to redo the color conversion.
+
+    Parameters
+    ----------
+    image : numpy.ndarray
+        The BGR sheet image, as read by cv2.imread, or an image that's already grayscale.
+    threshold_value : int
+        Pixels darker than or equal to this are ink. Comes from "threshold_value" in the config.
+
+    Returns
+    -------
+    gray : numpy.ndarray
+        The sheet in grayscale.
+    ink : numpy.ndarray
+        255 where there's ink, 0 where there's paper.
+    """
+    if image.ndim == 3:
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    else:
+        gray = image
+    _, ink = cv2.threshold(gray, threshold_value, 255, cv2.THRESH_BINARY_INV)
+    return gray, ink
+
+
+def trace_threshold(metadata):
+    """Threshold for the resized glyph, right before it's traced.
+
+    This is applied to the same grayscale values as `binarize`, after the cell
+    has been resized to the tracing resolution.
+
+    Parameters
+    ----------
+    metadata : dict
+        Dictionary containing the metadata. Only "sheetversion" is used.
+
+    Returns
+    -------
+    int
+        Pixels lighter than or equal to this are paper.
+    """
+    sheet_version = metadata.get("sheetversion") or "99999999.999999.999999"
+    # Changed from 200 to 127, which makes two of the 2.0.0 fonts look worse, but improves just about everything newer.
+    if Version(sheet_version) > Version("2"):
+        return 127
+    else:
+        return 200
@@ -1,18 +1,23 @@
 import os
+import sys
 import shutil
 import argparse
 import tempfile
-import json
 
 from handwrite import SHEETtoPNG
 from handwrite import PNGtoSVG
 from handwrite import SVGtoTTF
+from handwrite.debug import DEBUG_LEVELS
+from handwrite.glyphtable import GlyphTable
 
 
 def run(sheet, output_directory, characters_dir, config, metadata, other_words_string):
-    SHEETtoPNG().convert(sheet, characters_dir, config, metadata)
-    PNGtoSVG().convert(metadata, directory=characters_dir)
+    sheet_to_png = SHEETtoPNG()
+    sheet_to_png.convert(sheet, characters_dir, config, metadata)
+    PNGtoSVG().convert(metadata, directory=characters_dir, config=config)
     SVGtoTTF().convert(characters_dir, output_directory, config, metadata, other_words_string)
+    # the preview is saved in the background, while the font is being made
+    sheet_to_png.wait()
 
 
 def converters(sheet, output_directory, directory=None, config=None, metadata=None, other_words_string=None):
@@ -26,16 +31,23 @@ def converters(sheet, output_directory, directory=None, config=None, metadata=No
         print("Debug directory does not exist. Creating it at", directory)
         os.makedirs(directory, exist_ok=True)
 
+    metadata = dict(metadata or {})
+    if not metadata.get("debug"):
+        # nobody's going to look at analysis PNGs in a temp dir
+        metadata["debug"] = "off" if isTempdir else "full"
+
     if config is None:
         default_config = os.path.join(
             os.path.dirname(os.path.realpath(__file__)), "default.json"
         )
         config = default_config
-    shutil.copy(config, directory)
-    config = os.path.join(directory, os.path.basename(config))
+    if os.path.isdir(config):
+        raise IsADirectoryError("Config parameter should not be a directory.")
 
-    with open(config, "r") as file:
-        font_data = json.load(file)
+    # parsed once, here, and handed to every stage.
+    # the copy in the debug directory is what the FontForge script reads
+    table = GlyphTable.load(config)
+    config = os.path.join(directory, os.path.basename(config))
 
     if other_words_string:
         other_words = other_words_string.split()
@@ -83,59 +95,95 @@ def converters(sheet, output_directory, directory=None, config=None, metadata=No
                 # also "one" and "nine" are valid toki pona, and may rarely cause name collisions.
                 word = "".join(letters)
 
-                glyph_json = font_data['glyphs-fancy']
+                cell = blank_cells[position]
 
                 if   word == "apeja":
-                    glyph_json[blank_cells[position]] = {"name": word + "Tok", "ligature": " ".join(letters), "codepoint": "0xf19a1"}
+                    table.replace(
+                        cell,
+                        {
+                            "name": word + "Tok",
+                            "ligature": " ".join(letters),
+                            "codepoint": "0xf19a1",
+                        },
+                    )
                 elif word == "kokosila":
-                    glyph_json[blank_cells[position]] = {"name": word + "Tok", "ligature": " ".join(letters), "codepoint": "0xf1984"}
+                    table.replace(
+                        cell,
+                        {
+                            "name": word + "Tok",
+                            "ligature": " ".join(letters),
+                            "codepoint": "0xf1984",
+                        },
+                    )
                 elif word == "pake":
-                    glyph_json[blank_cells[position]] = {"name": word + "Tok", "ligature": " ".join(letters), "codepoint": "0xf19a0"}
+                    table.replace(
+                        cell,
+                        {
+                            "name": word + "Tok",
+                            "ligature": " ".join(letters),
+                            "codepoint": "0xf19a0",
+                        },
+                    )
                 elif word == "powe":
-                    glyph_json[blank_cells[position]] = {"name": word + "Tok", "ligature": " ".join(letters), "codepoint": "0xf19a3"}
+                    table.replace(
+                        cell,
+                        {
+                            "name": word + "Tok",
+                            "ligature": " ".join(letters),
+                            "codepoint": "0xf19a3",
+                        },
+                    )
                 else:
 
                     # check if it's a redraw of an existing sheet glyph
-                    for default_glyph in glyph_json:
-                        if 'name' in default_glyph:
-                            if default_glyph['name'] == word + "Tok":
-                                if 'codepoint' in default_glyph:
-                                    glyph_json[blank_cells[position]]['codepoint'] = default_glyph['codepoint']
-                                    del default_glyph['codepoint']
-                                del default_glyph['name']
-                                if 'ligature' in default_glyph:
-                                    del default_glyph['ligature']
-                                # todo: replace ASCII A E N O, too
-                                    # lowercase seems to work already
-                                # todo: remove redundant glyphs from the preview web page
-                                # probably never: allow replacing anything from row[6]
-
-                    glyph_json[blank_cells[position]]['name'] = word + "Tok"
-                    glyph_json[blank_cells[position]]['ligature'] = " ".join(letters)
-
-    with open(config, "w") as file:
-        json.dump(font_data, file, indent=4)
+                    redraw = table.cell(word + "Tok")
+                    if redraw is not None:
+                        default_glyph = table[redraw]
+                        if "codepoint" in default_glyph:
+                            table.update(cell, codepoint=default_glyph["codepoint"])
+                            table.update(redraw, codepoint=None)
+                        table.update(redraw, name=None, ligature=None)
+                        # todo: replace ASCII A E N O, too
+                        # lowercase seems to work already
+                        # todo: remove redundant glyphs from the preview web page
+                        # probably never: allow replacing anything from row[6]
 
-    if os.path.isdir(config):
-        raise IsADirectoryError("Config parameter should not be a directory.")
+                    table.update(cell, name=word + "Tok", ligature=" ".join(letters))
+
+    table.save(config)
 
     if os.path.isdir(sheet):
         raise IsADirectoryError("Sheet parameter should not be a directory.")
     else:
-        run(sheet, output_directory, directory, config, metadata, other_words_string)
+        run(sheet, output_directory, directory, table, metadata, other_words_string)
 
     if isTempdir:
         shutil.rmtree(directory)
 
 
 def main():
+    # `handwrite check sheet.png` only checks the sheet, see check.py
+    if len(sys.argv) > 1 and sys.argv[1] == "check":
+        from handwrite.check import main as check_main
+
+        sys.exit(check_main(sys.argv[2:]))
+
     print("If you get errors, try `handwrite --help`. Also check the analysis PNGs in the debug directory.")
     parser = argparse.ArgumentParser()
     parser.add_argument("input_path", help="Path to sample sheet")
     parser.add_argument("output_directory", help="Directory Path to save font output")
     parser.add_argument("--debug-directory", help="Generate in-progress PNGs, BMPs, SVGs, SFDs, and TTFs to this path \
         (Temp by default)", default=None)
-    parser.add_argument("--filename", help="Font File name (\"MyFont\" by default)", default=None)
+    parser.add_argument(
+        "--debug",
+        choices=DEBUG_LEVELS,
+        help='Which analysis PNGs to write to the debug directory: \
+        none, just "analysis PREVIEW.png", or every step ("full" with --debug-directory, "off" without)',
+        default=None,
+    )
+    parser.add_argument(
+        "--filename", help='Font File name ("MyFont" by default)', default=None
+    )
     parser.add_argument("--family", help="Font Family name (filename by default)", default=None)
     parser.add_argument("--designer", help="Font Designer name (\"me\" by default)", default=None)
     parser.add_argument("--license", help="Font License. \
@@ -152,16 +200,95 @@ def main():
         _ api Keli melome Pingo penpo poni snoweli \
         _ kan kulijo misa molusa oke pa panke polinpin tona wa wasoweli waken\"`)""", default=None)
     parser.add_argument("--pixel", action='store_true', help="Pixel font (experimental, false by default)", default=False)
+    parser.add_argument(
+        "--registration",
+        choices=["auto", "rows", "homography"],
+        help='How to line the sheet up with \
+        the template. "rows" measures each row separately. "homography" warps the whole sheet to fit the template, \
+        which helps with tilted photos. ("auto" by default: homography, only if the rows are tilted)',
+        default=None,
+    )
+    parser.add_argument(
+        "--large-scan",
+        action="store_true",
+        help="Use less memory on huge photos or scans of the sheet, \
+        like 40-60 megapixel photos. Only rows are kept at full resolution, and debug PNGs are smaller. \
+        Prints peak memory use. (false by default)",
+        default=False,
+    )
+    parser.add_argument(
+        "--jobs",
+        type=int,
+        help="Number of threads for cropping, saving and tracing cells. \
+        The output is the same with any number. (number of CPUs by default)",
+        default=None,
+    )
+    parser.add_argument(
+        "--tracer",
+        choices=["potrace", "opencv", "pixel"],
+        help='How to turn glyph bitmaps into outlines. \
+        "potrace" runs potrace, which has to be installed. "opencv" traces in Python, with OpenCV, without \
+        starting a process per glyph. Its outlines are close to potrace\'s, but not the same. "pixel" outlines \
+        the pixels of a pixel font exactly, on the grid they were drawn on. \
+        ("pixel" with --pixel, "potrace" otherwise)',
+        default=None,
+    )
+    parser.add_argument(
+        "--trace-resolution",
+        choices=["fixed", "adaptive"],
+        help='Size to resize glyphs to before \
+        tracing them. "fixed" is one size per sheet version. "adaptive" measures each glyph, and traces thick, \
+        simple ones at half or three quarters of that size, which is faster and makes fewer points. ("fixed" by default)',
+        default=None,
+    )
+    parser.add_argument(
+        "--trace-batch",
+        type=int,
+        help="Number of glyphs to trace with each potrace process. \
+        Fewer processes start, but each batch goes through temp files instead of a pipe. \
+        (1 by default: one potrace per glyph)",
+        default=None,
+    )
+    parser.add_argument(
+        "--cache",
+        help="Directory to keep traced outlines in, across runs. Glyphs that haven't \
+        changed since an earlier run with the same directory aren't traced or imported again. (no cache by default)",
+        default=None,
+    )
+    parser.add_argument(
+        "--cache-size",
+        type=float,
+        help="Size limit for the --cache directory, in MB. \
+        The least recently used outlines are deleted first. (256 by default)",
+        default=None,
+    )
+    parser.add_argument(
+        "--atlas",
+        action="store_true",
+        help="Keep the glyphs in one file, glyphs.atlas, instead of \
+        a directory per glyph with a PNG, a BMP and an SVG in it. (false by default)",
+        default=False,
+    )
 
     args = parser.parse_args()
     metadata = {
-        "filename": args.filename, 
-        "family": args.family, 
-        "designer": args.designer, 
-        "license": args.license, 
-        "licenseurl": args.license_url, 
+        "filename": args.filename,
+        "family": args.family,
+        "designer": args.designer,
+        "license": args.license,
+        "licenseurl": args.license_url,
         "sheetversion": args.sheet_version,
-        "pixel": args.pixel
+        "pixel": args.pixel,
+        "large_scan": args.large_scan,
+        "registration": args.registration,
+        "debug": args.debug,
+        "atlas": args.atlas,
+        "jobs": args.jobs,
+        "trace_batch": args.trace_batch,
+        "tracer": args.tracer,
+        "trace_resolution": args.trace_resolution,
+        "cache": args.cache,
+        "cache_size": args.cache_size,
     }
     converters(
         args.input_path, args.output_directory, args.debug_directory, None, metadata, args.other_words
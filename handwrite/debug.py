@@ -0,0 +1,96 @@
+import threading
+
+import cv2
+
+# How many analysis images to write to the debug directory.
+#   off:     none. The default when the debug directory is a temp dir that gets deleted anyway.
+#   summary: just "analysis PREVIEW.png".
+#   full:    the preview, plus the analysis steps and the 9 rows, at full resolution.
+DEBUG_LEVELS = ("off", "summary", "full")
+
+
+def debug_level(metadata):
+    """Debug level from the metadata, "full" if it isn't set.
+
+    Parameters
+    ----------
+    metadata : dict
+        Dictionary containing the metadata. Only "debug" is used.
+
+    Returns
+    -------
+    str
+        One of DEBUG_LEVELS.
+    """
+    level = metadata.get("debug") or "full"
+    if level not in DEBUG_LEVELS:
+        raise ValueError(
+            f"Debug level should be one of {', '.join(DEBUG_LEVELS)}, not {level!r}."
+        )
+    return level
+
+
+class DebugOverlay:
+    """The shapes drawn on "analysis PREVIEW.png", recorded so they can be drawn later, or never.
+
+    Recording a shape is just appending a tuple, so the pipeline can draw every
+    cell without paying for it when the preview isn't wanted. Takes the same
+    arguments as PIL.ImageDraw.Draw, in sheet coordinates.
+    """
+
+    def __init__(self):
+        self.operations = []
+        self.thread = None
+
+    def polygon(self, xy, **kwargs):
+        self.operations.append(("polygon", list(xy), kwargs))
+
+    def rectangle(self, xy, **kwargs):
+        self.operations.append(("rectangle", list(xy), kwargs))
+
+    def render(self, image, scale=1):
+        """Draw every recorded shape on a copy of `image`.
+
+        Parameters
+        ----------
+        image : numpy.ndarray
+            The sheet, either BGR like cv2.imread, or grayscale.
+        scale : int, default=1
+            How much smaller `image` is than the sheet.
+
+        Returns
+        -------
+        PIL.Image.Image
+            The preview, in RGB.
+        """
+        from PIL import Image, ImageDraw
+
+        if image.ndim == 3:
+            image = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
+        preview = Image.fromarray(image).convert("RGB")
+        draw = ImageDraw.Draw(preview)
+        for shape, xy, kwargs in self.operations:
+            if shape == "polygon":
+                getattr(draw, shape)([(x / scale, y / scale) for x, y in xy], **kwargs)
+            else:
+                getattr(draw, shape)([v / scale for v in xy], **kwargs)
+        return preview
+
+    def save(self, image, path, scale=1, background=True):
+        """Render the preview and save it to `path`, on a background thread by default.
+
+        Call `wait` before deleting the directory it's saved in.
+        """
+        if background:
+            self.thread = threading.Thread(
+                target=self.save, args=(image, path, scale, False)
+            )
+            self.thread.start()
+        else:
+            self.render(image, scale).save(path)
+
+    def wait(self):
+        """Wait for a preview that's being saved in the background."""
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
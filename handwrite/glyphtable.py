@@ -0,0 +1,119 @@
+import json
+
+
+class GlyphTable:
+    """A config and its "glyphs-fancy" list, indexed by glyph name, codepoint and ligature.
+
+    Built once per run, by `cli.converters`, and handed to every stage instead of a path,
+    so the config is parsed once. Every lookup is a dict lookup, however many glyphs there are.
+    The FontForge script runs in another process, so it reads the copy that `save` wrote.
+
+    Entries of "glyphs-fancy" are in sheet order: entry i is cell i, and cells
+    without a name are skipped. Change entries with `update` or `replace`,
+    so the indexes stay right.
+
+    Parameters
+    ----------
+    config : dict
+        The parsed config file.
+    path : str, optional
+        Where the config was read from, or last saved to.
+    """
+
+    def __init__(self, config, path=None):
+        self.config = config
+        self.path = path
+        self.glyphs = config.setdefault("glyphs-fancy", [])
+        self.by_name = {}
+        self.by_codepoint = {}
+        self.by_ligature = {}
+        for cell in range(len(self.glyphs)):
+            self._index(cell)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(json.load(f), path)
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump(self.config, f, indent=4)
+        self.path = path
+
+    def __len__(self):
+        return len(self.glyphs)
+
+    def __getitem__(self, cell):
+        return self.glyphs[cell]
+
+    @property
+    def threshold_value(self):
+        return self.config.get("threshold_value", 200)
+
+    def names(self):
+        """Glyph name of every cell, None for cells without one."""
+        return [glyph.get("name") for glyph in self.glyphs]
+
+    def cell(self, name):
+        """Cell of the glyph with this name, or None."""
+        return self._first(self.by_name, name)
+
+    def codepoint_cell(self, codepoint):
+        """Cell of the glyph with this codepoint, as an int, or None."""
+        return self._first(self.by_codepoint, codepoint)
+
+    def ligature_cell(self, ligature):
+        """Cell of the glyph with this ligature, like "a k e s i", or None."""
+        return self._first(self.by_ligature, ligature)
+
+    def update(self, cell, **fields):
+        """Set fields of a glyph. A field set to None is removed."""
+        self._unindex(cell)
+        for key, value in fields.items():
+            if value is None:
+                self.glyphs[cell].pop(key, None)
+            else:
+                self.glyphs[cell][key] = value
+        self._index(cell)
+
+    def replace(self, cell, glyph):
+        """Replace a glyph entirely."""
+        self._unindex(cell)
+        self.glyphs[cell] = glyph
+        self._index(cell)
+
+    # Each index maps a key to the cells that have it, in order. Keys are nearly always unique,
+    # but if they aren't, the first cell wins, like a search through the list would find.
+    def _first(self, index, key):
+        cells = index.get(key)
+        return cells[0] if cells else None
+
+    def _keys(self, cell):
+        glyph = self.glyphs[cell]
+        codepoint = int(glyph["codepoint"], 16) if "codepoint" in glyph else None
+        return (
+            (self.by_name, glyph.get("name")),
+            (self.by_codepoint, codepoint),
+            (self.by_ligature, glyph.get("ligature")),
+        )
+
+    def _index(self, cell):
+        for index, key in self._keys(cell):
+            if key is not None:
+                cells = index.setdefault(key, [])
+                cells.append(cell)
+                cells.sort()
+
+    def _unindex(self, cell):
+        for index, key in self._keys(cell):
+            if key is not None:
+                index[key].remove(cell)
+                if not index[key]:
+                    del index[key]
+
+
+def glyph_table(config):
+    """The GlyphTable for `config`, which is a GlyphTable already, or a path to a config file."""
+    if isinstance(config, GlyphTable):
+        return config
+    return GlyphTable.load(config)
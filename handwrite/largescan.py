@@ -0,0 +1,106 @@
+import sys
+import cv2
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+# cv2 can decode a JPEG at 1/2, 1/4 or 1/8 of its size,
+# which skips most of the decoding work and most of the memory.
+REDUCED_GRAYSCALE = {
+    1: cv2.IMREAD_GRAYSCALE,
+    2: cv2.IMREAD_REDUCED_GRAYSCALE_2,
+    4: cv2.IMREAD_REDUCED_GRAYSCALE_4,
+    8: cv2.IMREAD_REDUCED_GRAYSCALE_8,
+}
+
+
+def is_jpeg(path):
+    """Check whether a file is a JPEG by its first bytes, rather than its extension."""
+    with open(path, "rb") as f:
+        return f.read(3) == b"\xff\xd8\xff"
+
+
+def sheet_size(path):
+    """Width and height of a sheet, read from its header, without decoding any pixels."""
+    from PIL import Image
+
+    with Image.open(path) as image:
+        return image.size
+
+
+def read_reduced(path, factor):
+    """Decode a JPEG in grayscale, at 1/`factor` of its size. `factor` is 1, 2, 4 or 8."""
+    return cv2.imread(path, REDUCED_GRAYSCALE[factor])
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process so far, in megabytes, or None if it can't be measured."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # kilobytes on Linux, but bytes on macOS
+    if sys.platform == "darwin":
+        peak /= 1024
+    return peak / 1024
+
+
+class RowStrips:
+    """The horizontal strips of a sheet that are kept at full resolution, in large scan mode.
+
+    Slicing it with sheet coordinates returns a view into the strip that contains
+    them, so code that measures and crops cells can use it like the whole sheet.
+    Anything outside the strips was freed, and raises an IndexError.
+
+    Parameters
+    ----------
+    shape : tuple of int
+        Shape of the whole sheet.
+    strips : list of (int, numpy.ndarray)
+        Top of each strip in sheet coordinates, and its pixels.
+    """
+
+    def __init__(self, shape, strips):
+        self.shape = shape
+        self.strips = strips
+
+    @classmethod
+    def cut(cls, image, spans):
+        """Copy full width strips out of `image`, so `image` itself can be freed.
+
+        Parameters
+        ----------
+        image : numpy.ndarray
+            The whole sheet.
+        spans : list of (int, int)
+            Top and bottom of each strip. They're clamped to the sheet, and merged if they overlap.
+        """
+        merged = []
+        for top, bottom in sorted(spans):
+            top, bottom = max(top, 0), min(bottom, image.shape[0])
+            if merged and top <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], bottom)
+            else:
+                merged.append([top, bottom])
+        return cls(
+            image.shape, [(top, image[top:bottom].copy()) for top, bottom in merged]
+        )
+
+    def map(self, function):
+        """Apply `function` to the pixels of every strip, like `binarize`."""
+        return RowStrips(
+            self.shape, [(top, function(strip)) for top, strip in self.strips]
+        )
+
+    def __getitem__(self, key):
+        rows, cols = key
+        top = 0 if rows.start is None else rows.start
+        bottom = self.shape[0] if rows.stop is None else min(rows.stop, self.shape[0])
+        for strip_top, strip in self.strips:
+            if strip_top <= top and bottom <= strip_top + strip.shape[0]:
+                return strip[top - strip_top : bottom - strip_top, cols]
+        raise IndexError(
+            f"rows {top} to {bottom} of the sheet weren't kept in large scan mode"
+        )
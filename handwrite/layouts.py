@@ -0,0 +1,96 @@
+# Geometry of each sheet version, in one place.
+# SHEETtoPNG, PNGtoSVG and SVGtoTTF all look up their sheet version here.
+# svgtottf.py runs in FontForge's Python, so it gets its layout through the metadata JSON
+# instead of importing this module. So layouts are plain JSON-able data.
+
+# SHEET VERSION 2:
+# The grid unit here is roughly 0.125cm on the printed page, or 0.25cm in the original huge file.
+SHEET_V2_GRID = {
+    "grid": "v2",
+    # Each row bounding box (black line) is 164*12,
+    "grid_row_w": 164,
+    "grid_row_h": 12,
+    # with 2 hor padding and 1 ver padding on each side.
+    "grid_hor_padding": 2,
+    "grid_ver_padding": 1,
+    # There are 20 glyphs per row. Each glyph scan area is 8x10.
+    "grid_scan_w": 8,
+    "grid_scan_h": 10,
+    # The visible gray squares are 7x7, to help with human and scanning errors.
+    "grid_glyph_w": 7,
+    "grid_scan_hor_padding": 0.5,
+    # Metrics in FontForge, before scaling (BS) up so that the glyph is the full em height
+    "bs_scan_hor_padding": 50,
+    "bs_glyph_wh": 700,
+    # Entry of templates.TEMPLATES that skewed scans are registered against
+    "reference": "sheet v2",
+}
+
+# SHEET VERSION 3:
+# The grid unit here is roughly 1/6cm on the printed page, or 1/3cm in the original huge file.
+SHEET_V3_GRID = {
+    "grid": "v3",
+    # Each row bounding box (black line) is 126x12,
+    "grid_row_w": 126,
+    "grid_row_h": 12,
+    # with 3 hor padding and 2 ver padding on each side.
+    "grid_hor_padding": 3,
+    "grid_ver_padding": 2,
+    # There are 20 glyphs per row. Each glyph scan area is 6x8.
+    "grid_scan_w": 6,
+    "grid_scan_h": 8,
+    # The visible gray squares are 4x4, to help with human and scanning errors.
+    "grid_glyph_w": 4,
+    "grid_scan_hor_padding": 1,
+    # Metrics in FontForge, before scaling (BS) up so that the glyph is the full em height
+    "bs_scan_hor_padding": 125,
+    "bs_glyph_wh": 500,
+    "reference": "template.png (sheet v3)",
+}
+
+# Each layout applies from its "since" version up to the next one.
+# "trace_size" is the (width, height) each cell is resized to before tracing.
+LAYOUTS = [
+    {
+        **SHEET_V2_GRID,
+        "since": "0",
+        # scan 2.0.x sheets with lower quality, to avoid picking up corner pixels from the gray boxes
+        "trace_size": (100, 125),
+    },
+    {
+        **SHEET_V2_GRID,
+        "since": "2.1",
+        # good balance.
+        # 40x50 is faster & lower quality, for testing. 400x500 has no visible improvement.
+        "trace_size": (200, 250),
+    },
+    {
+        **SHEET_V3_GRID,
+        "since": "3",
+        # good balance.
+        # 36x48, 72x96 and 144x192 are faster & lower quality, for testing.
+        # 576x768 has no visible improvement and is really huge, probably?
+        "trace_size": (288, 384),
+    },
+]
+
+
+def sheet_layout(sheet_version):
+    """Layout for a sheet version, the latest one if the version isn't set.
+
+    Parameters
+    ----------
+    sheet_version : str or None
+        The sheet version, like "2.0.2". Usually metadata["sheetversion"].
+
+    Returns
+    -------
+    dict
+        The entry of LAYOUTS that the version falls in.
+    """
+    from packaging.version import Version
+
+    sheet_version = Version(sheet_version or "99999999.999999.999999")
+    return [layout for layout in LAYOUTS if sheet_version >= Version(layout["since"])][
+        -1
+    ]
@@ -0,0 +1,122 @@
+import hashlib
+import os
+import tempfile
+import threading
+
+# Outlines from earlier runs, so a sheet with a few glyphs redrawn only traces those few.
+#
+# One directory, shared by every run that's given it, with a file per entry:
+#   <key>.svg       potrace's SVG for a cell. The key hashes the cell's pixels and every
+#                   parameter that changes how it's traced, see pngtosvg.cache_key.
+#   <key>.outline   FontForge's contours after importOutlines and removeOverlap, as JSON.
+#                   The key hashes the SVG they were imported from.
+#
+# Entries are written to a temp file first and renamed, so runs can share the directory.
+# Reading an entry touches it, and when a run is done, the least recently used entries
+# are deleted until the directory is under its size limit.
+#
+# Like atlas.py, only the standard library is imported, so FontForge's Python can use it.
+CACHE_VERSION = b"1"
+DEFAULT_CACHE_MB = 256
+
+
+class OutlineCache:
+    """A directory of outlines from earlier runs, by content hash. See the top of outlinecache.py.
+
+    Parameters
+    ----------
+    directory : str
+        The cache directory. Made if it doesn't exist.
+    max_bytes : int, optional
+        Size limit for the whole directory, enforced by `close`.
+    """
+
+    def __init__(self, directory, max_bytes=DEFAULT_CACHE_MB * 2 ** 20):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.hits = {}
+        self.misses = {}
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    @staticmethod
+    def key(*parts):
+        """Hex digest of `parts`, each bytes or str."""
+        digest = hashlib.sha256(CACHE_VERSION)
+        for part in parts:
+            part = part.encode("utf-8") if isinstance(part, str) else bytes(part)
+            digest.update(len(part).to_bytes(8, "little"))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def path(self, key, kind):
+        return os.path.join(self.directory, key + "." + kind)
+
+    def get(self, key, kind):
+        """The entry's bytes, or None. Counts a hit or a miss."""
+        path = self.path(key, kind)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+        except FileNotFoundError:
+            data = None
+        with self.lock:
+            counts = self.misses if data is None else self.hits
+            counts[kind] = counts.get(kind, 0) + 1
+        return data
+
+    def put(self, key, kind, data):
+        fd, scratch = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(scratch, self.path(key, kind))
+
+    def stats(self):
+        """{kind: {"hits": ..., "misses": ...}} for this run."""
+        return {
+            kind: {"hits": self.hits.get(kind, 0), "misses": self.misses.get(kind, 0)}
+            for kind in sorted(set(self.hits) | set(self.misses))
+        }
+
+    def summary(self):
+        return "Outline cache: " + ", ".join(
+            f"{kind} {counts['hits']} hits, {counts['misses']} misses"
+            for kind, counts in self.stats().items()
+        )
+
+    def evict(self):
+        """Delete least recently used entries until the directory fits in max_bytes."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.path, stat.st_size))
+        total = sum(size for _, _, size in entries)
+        for _, path, size in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def close(self):
+        self.evict()
+
+
+def outline_cache(metadata):
+    """The OutlineCache in metadata["cache"], limited to metadata["cache_size"] MB, or None without one."""
+    if not metadata.get("cache"):
+        return None
+    return OutlineCache(
+        metadata["cache"],
+        int((metadata.get("cache_size") or DEFAULT_CACHE_MB) * 2 ** 20),
+    )
@@ -1,61 +1,393 @@
 from PIL import Image, ImageChops
+import itertools
+import numpy as np
 import os
 import shutil
 import subprocess
 import json
 
+from handwrite.atlas import GlyphDirectory, bitmap_image, glyph_store
+from handwrite.binarize import trace_threshold
+from handwrite.debug import debug_level
+from handwrite.glyphtable import glyph_table
+from handwrite.layouts import sheet_layout
+from handwrite.outlinecache import OutlineCache, outline_cache
+from handwrite.qa import cell_metrics
+from handwrite.tracers import (
+    PotraceNotFound,
+    find_potrace,
+    pbm,
+    rescale_svg,
+    tracer_class,
+)
+from handwrite.workers import job_count, ordered_map
 
+# With metadata["trace_resolution"] = "adaptive", each glyph is traced at the smallest of these
+# fractions of the layout's trace_size that keeps its strokes at least MIN_TRACE_STROKE trace pixels wide.
+# Glyphs with more than MAX_ADAPTIVE_CONTOURS outlines and holes are intricate, and keep the full size.
+ADAPTIVE_SCALES = (0.5, 0.75, 1)
+MIN_TRACE_STROKE = 8
+MAX_ADAPTIVE_CONTOURS = 12
 
-class PotraceNotFound(Exception):
-    pass
+
+def trace_size(cell, metadata):
+    """Size to resize a cell to before tracing it.
+
+    The layout's trace_size, unless metadata["trace_resolution"] is "adaptive". Then it's measured
+    on the cell, at its own resolution: stroke width from the ink area and outline, like qa.py does,
+    and the number of contours. Thick, simple glyphs trace at half size, and thin or intricate ones
+    at full size. Pixel fonts always trace at full size, so PixelTracer can find their grid.
+
+    Parameters
+    ----------
+    cell : PIL.Image.Image
+        The grayscale cell.
+    metadata : dict
+        Dictionary containing the metadata. Uses "sheetversion", "pixel" and "trace_resolution".
+
+    Returns
+    -------
+    tuple of int
+        (width, height).
+    """
+    width, height = sheet_layout(metadata.get("sheetversion"))["trace_size"]
+    mode = metadata.get("trace_resolution") or "fixed"
+    if mode not in ("fixed", "adaptive"):
+        raise ValueError(f"trace_resolution should be fixed or adaptive, not {mode!r}.")
+    if mode == "fixed" or metadata.get("pixel"):
+        return width, height
+
+    import cv2
+
+    gray = np.asarray(cell)
+    threshold = trace_threshold(metadata)
+    # in trace pixels, at full size
+    stroke_width = (
+        cell_metrics([gray], threshold)["stroke_width"][0] * width / gray.shape[1]
+    )
+    contours, _ = cv2.findContours(
+        (gray < threshold).view(np.uint8), cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE
+    )
+    if len(contours) > MAX_ADAPTIVE_CONTOURS:
+        return width, height
+    scale = next(
+        scale
+        for scale in ADAPTIVE_SCALES
+        if scale == 1 or stroke_width * scale >= MIN_TRACE_STROKE
+    )
+    return round(width * scale), round(height * scale)
+
+
+def heaviest_first(inks):
+    """Order to trace glyphs in, so the slowest ones don't end up last, on one thread.
+
+    potrace's time goes mostly into following outlines, so a glyph's weight is
+    how many pixels its outlines run past. Ties keep glyph order.
+
+    Parameters
+    ----------
+    inks : list of numpy.ndarray
+        Binarized glyphs, from `PNGtoSVG.ink`.
+
+    Returns
+    -------
+    list of int
+        Indexes into `inks`, heaviest first.
+    """
+    weights = [
+        np.count_nonzero(ink[:, 1:] != ink[:, :-1])
+        + np.count_nonzero(ink[1:] != ink[:-1])
+        for ink in inks
+    ]
+    return sorted(range(len(inks)), key=lambda i: -weights[i])
+
+
+def batch_size(metadata):
+    """Number of glyphs per potrace process, from metadata["trace_batch"], or 1.
+
+    The default of 1 still starts a potrace for every glyph, so only --trace-batch saves
+    the process starts. Batching isn't the default until it's been timed against potrace
+    itself, since a batch goes through temp files instead of pipes.
+
+    Parameters
+    ----------
+    metadata : dict
+        Dictionary containing the metadata. Only "trace_batch" is used.
+
+    Returns
+    -------
+    int
+        At least 1. With 1, each glyph goes to its own potrace through a pipe.
+    """
+    size = metadata.get("trace_batch") or 1
+    if int(size) < 1:
+        raise ValueError(f"trace_batch should be at least 1, not {size!r}.")
+    return int(size)
+
+
+def cache_key(cell, metadata, tracer=None):
+    """Key of a cell's SVG in the OutlineCache: its pixels, and everything that changes how it's traced.
+
+    `tracer` is the one the cell is traced with, so its settings are in the key too.
+    By default, a new one of `tracer_class`.
+    """
+    if tracer is None:
+        tracer = tracer_class(metadata)()
+    params = {
+        "trace_size": sheet_layout(metadata.get("sheetversion"))["trace_size"],
+        "threshold": trace_threshold(metadata),
+        "pixel": bool(metadata.get("pixel")),
+        "sheetversion": metadata.get("sheetversion"),
+        "tracer": tracer.key,
+        "trace_resolution": metadata.get("trace_resolution") or "fixed",
+    }
+    cell = np.ascontiguousarray(cell)
+    return OutlineCache.key(
+        json.dumps(params, sort_keys=True), str(cell.shape), cell.tobytes()
+    )
 
 
 class PNGtoSVG:
     """Converter class to convert character PNGs to BMPs and SVGs."""
 
-    def convert(self, metadata, directory):
+    def convert(self, metadata, directory, config=None):
         print("PNGtoSVG", end="\r")
-        """Call converters on each .png in the provider directory.
+        """Call converters on each glyph .png in the provider directory.
+
+        Convert every glyph from sheettopng, png -> svg, next to its .png.
+        Which glyphs is up to `manifest`, so other PNGs in the directory,
+        like the analysis images, aren't traced.
+        Bitmaps go to the tracer, potrace through a pipe by default (see tracers.py),
+        and only get saved as .bmp files when the debug level is "full".
+        Glyphs are binarized and traced on metadata["jobs"] threads
+        (number of CPUs by default). Each potrace is its own process,
+        so threads are enough, and every glyph is written to its own files.
+        With metadata["cache"], glyphs that were traced the same way in an
+        earlier run come from the outline cache instead, see outlinecache.py.
 
-        Walk through the custom directory containing all .png files
-        from sheettopng and convert them to png -> bmp -> svg.
+        Parameters
+        ----------
+        metadata : dict
+            Dictionary containing the metadata.
+        directory : str
+            The characters directory from SHEETtoPNG.
+        config : GlyphTable or str, optional
+            The config the sheet was read with, or a path to it.
         """
-        num_characters = 0
-        path = os.walk(directory)
-        for root, dirs, files in path:
-            for f in files:
-                if f.endswith(".png"):
-                    num_characters += 1
-                    print("PNGtoSVG", str(f[0:-4]).ljust(14, " ")[:14], "".join("." for i in range(num_characters//8)), end="\r")
-                    self.pngToBmp(root + "/" + f, metadata)
-                    # self.trim(root + "/" + f[0:-4] + ".bmp")
-                    self.bmpToSvg(root + "/" + f[0:-4] + ".bmp")
+        if metadata.get("atlas"):
+            self.convert_atlas(metadata, directory, config)
+            return
+
+        store = GlyphDirectory(directory)
+        cache = outline_cache(metadata)
+        self.trace_store(
+            store,
+            self.manifest(store, config, metadata),
+            metadata,
+            debug_level(metadata) == "full",
+            cache,
+        )
         print("PNGtoSVG                                                                      ")
+        if cache is not None:
+            print(cache.summary())
 
-    def bmpToSvg(self, path):
-        """Convert .bmp image to .svg using potrace.
+    def convert_atlas(self, metadata, directory, config=None):
+        """Like `convert`, but reading cells from glyphs.atlas and adding bitmaps and SVGs to it.
 
-        Converts the passed .bmp file to .svg using the potrace
-        (http://potrace.sourceforge.net/). Each .bmp is passed as
-        a parameter to potrace which is called as a subprocess.
+        Nothing else is written, unless metadata["trace_batch"] asks potrace for batches:
+        potrace reads each bitmap from a pipe and writes its SVG to another,
+        and metadata["tracer"] = "opencv" doesn't need any pipes.
+        Tracing happens on metadata["jobs"] threads, but the atlas is written in glyph order
+        afterwards, so it's the same file with any number of jobs.
+        """
+        cache = outline_cache(metadata)
+        with glyph_store(directory, metadata) as atlas:
+            self.trace_store(
+                atlas, self.manifest(atlas, config, metadata), metadata, True, cache
+            )
+        print(
+            "PNGtoSVG                                                                      "
+        )
+        if cache is not None:
+            print(cache.summary())
+
+    def trace_store(self, store, names, metadata, bitmaps, cache=None):
+        """Binarize and trace the cells of `names`, and write their SVGs back to the store.
+
+        Glyphs in metadata["aliases"] share their source's cell, see SHEETtoPNG.save_images,
+        so only the source is traced, and its SVG is written for every alias too.
+        With a cache, cells that were traced the same way in an earlier run get their SVG
+        from it, and aren't traced again. Everything is written in `names` order.
 
         Parameters
         ----------
-        path : str
-            Path to the bmp file to be converted.
+        store : GlyphAtlas or GlyphDirectory
+            Where SHEETtoPNG saved the cells.
+        names : list of str
+            The glyphs to trace, from `manifest`.
+        metadata : dict
+            Dictionary containing the metadata.
+        bitmaps : bool
+            Also write the bitmap of every glyph to the store. They're all at the layout's
+            trace_size, like the SVGs, even the ones traced smaller, see `trace_size`.
+        cache : OutlineCache, optional
+            From `outline_cache`. Closed when everything's written.
+        """
+        jobs = job_count(metadata)
+        wanted = set(names)
+        source = {name: name for name in names}
+        for alias, name in (metadata.get("aliases") or {}).items():
+            if alias in wanted and name in wanted:
+                source[alias] = name
+        traced = list(dict.fromkeys(source.values()))
 
-        Raises
-        ------
-        PotraceNotFound
-            Raised if potrace not found in path by shutil.which()
+        tracer = tracer_class(metadata)()
+        cells = ordered_map(lambda name: store.read(name, "cell"), traced, jobs)
+        svgs = [None] * len(traced)
+        if cache is not None:
+            keys = [cache_key(cell, metadata, tracer) for cell in cells]
+            svgs = [cache.get(key, "svg") for key in keys]
+
+        # cached glyphs are only binarized for their bitmaps
+        binarize = [i for i, svg in enumerate(svgs) if svg is None or bitmaps]
+        inks = dict(
+            zip(
+                binarize,
+                ordered_map(
+                    lambda i: self.ink(Image.fromarray(cells[i]), metadata),
+                    binarize,
+                    jobs,
+                ),
+            )
+        )
+        trace = [i for i in binarize if svgs[i] is None]
+        for i, svg in zip(
+            trace,
+            self.trace_all(
+                [inks[i] for i in trace], [traced[i] for i in trace], metadata, tracer
+            ),
+        ):
+            svgs[i] = svg
+            if cache is not None:
+                cache.put(keys[i], "svg", svg)
+
+        # glyphs traced smaller get a bitmap at full size, to line up with their stretched SVG
+        if bitmaps:
+            width, height = sheet_layout(metadata.get("sheetversion"))["trace_size"]
+            fixed = {**metadata, "trace_resolution": "fixed"}
+            smaller = [i for i in binarize if inks[i].shape != (height, width)]
+            inks.update(
+                zip(
+                    smaller,
+                    ordered_map(
+                        lambda i: self.ink(Image.fromarray(cells[i]), fixed),
+                        smaller,
+                        jobs,
+                    ),
+                )
+            )
+
+        index = {name: i for i, name in enumerate(traced)}
+        for name in names:
+            i = index[source[name]]
+            if bitmaps:
+                store.write(name, "bitmap", inks[i])
+            store.write(name, "svg", svgs[i])
+        if cache is not None:
+            cache.close()
+
+    def manifest(self, store, config, metadata):
+        """Names of the glyphs to trace.
+
+        Every glyph name in the config, once and in config order, that SHEETtoPNG saved a cell for.
+        Without a config, every glyph in the store. Cells without ink have nothing to trace, see qa.py.
+
+        Parameters
+        ----------
+        store : GlyphAtlas or GlyphDirectory
+            Where SHEETtoPNG saved the cells.
+        config : GlyphTable or str or None
+            The config, or a path to it.
+        metadata : dict
+            Dictionary containing the metadata. Only "empty" is used.
+
+        Returns
+        -------
+        list of str
         """
-        if shutil.which("potrace") is None:
-            raise PotraceNotFound("Potrace is either not installed or not in path")
+        empty = set(metadata.get("empty") or [])
+        if config is None:
+            names = store.names("cell")
         else:
-            subprocess.run(["potrace", path, "--backend", "svg", "--output", path[0:-4] + ".svg",])
-            # note: the --margin parameter doesn't help me here
+            names = [
+                name
+                for name in dict.fromkeys(glyph_table(config).names())
+                if name and (name, "cell") in store
+            ]
+        return [name for name in names if name not in empty]
 
-    def pngToBmp(self, path, metadata):
+    def trace_all(self, inks, names, metadata, tracer=None):
+        """Trace every glyph, on metadata["jobs"] threads, in batches of metadata["trace_batch"].
+
+        The tracer is metadata["tracer"], see tracers.py: potrace by default, and pixel
+        with metadata["pixel"]. It's made once,
+        so potrace is looked up once. Glyphs are traced heaviest first, so the slowest ones
+        don't end up last, and batches are made in that order too.
+
+        Parameters
+        ----------
+        inks : list of numpy.ndarray
+            Binarized glyphs, from `ink`.
+        names : list of str
+            Their names, for the progress line.
+        metadata : dict
+            Dictionary containing the metadata. Uses "jobs", "trace_batch", "tracer", "pixel" and "sheetversion".
+        tracer : optional
+            The tracer to use, instead of a new one of `tracer_class`.
+
+        Returns
+        -------
+        list of bytes
+            The SVG of each glyph, in the same order as `inks`.
+        """
+        if not inks:
+            return []
+        if tracer is None:
+            tracer = tracer_class(metadata)()
+        order = heaviest_first(inks)
+        size = batch_size(metadata)
+        batches = [order[i : i + size] for i in range(0, len(order), size)]
+        progress = itertools.count(1)
+
+        def trace(batch):
+            for i in batch:
+                self.print_progress(names[i], next(progress))
+            return tracer.trace([inks[i] for i in batch])
+
+        # glyphs traced smaller than the layout's trace_size, see `trace_size`,
+        # are stretched back, so FontForge imports every glyph at the same scale
+        width, height = sheet_layout(metadata.get("sheetversion"))["trace_size"]
+        svgs = [None] * len(inks)
+        for batch, traced in zip(
+            batches, ordered_map(trace, batches, job_count(metadata))
+        ):
+            for i, svg in zip(batch, traced):
+                svgs[i] = (
+                    svg
+                    if inks[i].shape == (height, width)
+                    else rescale_svg(svg, (height, width))
+                )
+        return svgs
+
+    def print_progress(self, name, num_characters):
+        print(
+            "PNGtoSVG",
+            name.ljust(14, " ")[:14],
+            "".join("." for i in range(num_characters // 8)),
+            end="\r",
+        )
+
+    def bmpToSvg(self, path):
         """Convert .bmp image to .svg using potrace.
 
         Converts the passed .bmp file to .svg using the potrace
@@ -72,84 +404,67 @@ class PNGtoSVG:
         PotraceNotFound
             Raised if potrace not found in path by shutil.which()
         """
+        subprocess.run(
+            [
+                find_potrace(),
+                path,
+                "--backend",
+                "svg",
+                "--output",
+                path[0:-4] + ".svg",
+            ]
+        )
+        # note: the --margin parameter doesn't help me here
 
-        from packaging.version import Version
-        sheet_version = metadata.get("sheetversion") or "99999999.999999.999999"
-        if Version(sheet_version) < Version("2.1"):
-            # SHEET VERSION 2.0
-            # scan 2.0.x sheets with lower quality, to avoid picking up corner pixels from the gray boxes
-            glyph_width  = 100
-            glyph_height = 125
-        elif Version(sheet_version) < Version("3"):
-            # SHEET VERSION 2.1
-
-            # if os.path.basename(path) == "a.png":
-            #     print("⚠️ scanning at low quality")
-            # glyph_width  = 40 # faster & lower quality, for testing
-            # glyph_height = 50
-
-            # if os.path.basename(path) == "a.png":
-            #     print("⚠️ scanning at low quality")
-            # glyph_width  = 100
-            # glyph_height = 125
-
-            glyph_width  = 200 # good balance
-            glyph_height = 250
-
-            # if os.path.basename(path) == "a.png":
-            #     print("⚠️ scanning at unnecessarily high quality")
-            # glyph_width  = 400 # no visible improvement
-            # glyph_height = 500
-
-        else:
-            # SHEET VERSION 3
-
-            # if os.path.basename(path) == "a.png":
-            #     print("⚠️ scanning at low quality")
-            # glyph_width  = 36 # faster & lower quality, for testing
-            # glyph_height = 48
+    def pngToBmp(self, path, metadata):
+        """Threshold a cell PNG at the tracing resolution, and save it as a .bmp next to it.
 
-            # if os.path.basename(path) == "a.png":
-            #     print("⚠️ scanning at low quality")
-            # glyph_width  = 72
-            # glyph_height = 96
+        Parameters
+        ----------
+        path : str
+            Path to the cell's .png. The bitmap is saved as the same path, ending in .bmp.
+        metadata : dict
+            Dictionary containing the metadata, see `ink`.
 
-            # if os.path.basename(path) == "a.png":
-            #     print("⚠️ scanning at low quality")
-            # glyph_width  = 144
-            # glyph_height = 192
+        Returns
+        -------
+        numpy.ndarray
+            The bitmap, True where there's ink, from `ink`.
+        """
+        # cells are already grayscale slices of the sheet, from binarize() in SHEETtoPNG
+        ink = self.ink(Image.open(path).convert("L"), metadata)
+        bitmap_image(ink).save(path[0:-4] + ".bmp")
+        return ink
 
-            glyph_width  = 288 # good balance
-            glyph_height = 384
+    def ink(self, cell, metadata):
+        """Resize a cell to the tracing resolution, and threshold it.
 
-            # if os.path.basename(path) == "a.png":
-            #     print("⚠️ scanning at unnecessarily high quality")
-            # glyph_width  = 576 # no visible improvement and really huge, probably?
-            # glyph_height = 768
+        Parameters
+        ----------
+        cell : PIL.Image.Image
+            The grayscale cell.
+        metadata : dict
+            Dictionary containing the metadata. Uses "sheetversion", "pixel" and "trace_resolution".
 
+        Returns
+        -------
+        numpy.ndarray
+            True where there's ink, at the tracing resolution.
+        """
+        # per sheet version, from layouts.py, or per glyph with metadata["trace_resolution"] = "adaptive"
+        glyph_width, glyph_height = trace_size(cell, metadata)
 
         pixel = metadata.get("pixel") or False
         if pixel:
             resample = Image.Resampling.NEAREST
         else:
             resample = Image.Resampling.BICUBIC
-        img = Image.open(path).convert("RGBA").resize((glyph_width, glyph_height), resample=resample)
+        gray = cell.resize((glyph_width, glyph_height), resample=resample)
 
         # Threshold image to convert each pixel to either black or white.
-        # Changed from 200 to 127, which makes two of the 2.0.0 fonts look worse, but improves just about everything newer.
-        if Version(sheet_version) > Version("2"):
-            threshold = 127
-        else:
-            threshold = 200
-
-        data = []
-        for pix in list(img.getdata()):
-            if pix[0] >= threshold and pix[1] >= threshold and pix[3] >= threshold:
-                data.append((255, 255, 255, 0))
-            else:
-                data.append((0, 0, 0, 1))
-        img.putdata(data)
-        img.save(path[0:-4] + ".bmp")
+        # One comparison over the whole array, instead of a Python loop over 110k pixels.
+        threshold = trace_threshold(metadata)
+        return np.asarray(gray) < threshold
 
     def trim(self, im_path):
         im = Image.open(im_path)
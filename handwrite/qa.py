@@ -0,0 +1,138 @@
+import numpy as np
+
+# A cell with less than this fraction of ink is probably blank,
+# and one with more than this fraction is probably a smudge, a shadow or a scribble.
+# They're only warnings, for qa.json and `handwrite check`: a small period can be under
+# BLANK_COVERAGE and still be a glyph. Only glyphs with no ink at all aren't traced,
+# see SHEETtoPNG.save_images.
+BLANK_COVERAGE = 0.002
+OVERFULL_COVERAGE = 0.5
+
+# in the same order as the edges in cell_metrics
+EDGES = ("top", "right", "bottom", "left")
+
+
+def cell_metrics(cells, threshold):
+    """Measure every cell at once: ink coverage, ink bounding box, edge contact and stroke width.
+
+    Cells are a pixel or two different in size, so they're stacked into one array padded
+    with paper, and everything is measured on the whole stack.
+
+    Parameters
+    ----------
+    cells : list of numpy.ndarray
+        Grayscale cells, like the ones SHEETtoPNG saves.
+    threshold : int
+        Pixels darker than this are ink. Usually `trace_threshold`, so a coverage of 0 means
+        there's nothing to trace.
+
+    Returns
+    -------
+    dict
+        "coverage": fraction of each cell that's ink.
+        "bbox": (left, top, width, height) of the ink in each cell, all -1 if there's none.
+        "edges": whether the ink touches each edge, as (top, right, bottom, left),
+        which usually means it runs into the next cell.
+        "stroke_width": estimated stroke width in pixels, from the ink area and its outline.
+    """
+    heights = np.array([cell.shape[0] for cell in cells])
+    widths = np.array([cell.shape[1] for cell in cells])
+    stack = np.full(
+        (len(cells), heights.max(initial=1), widths.max(initial=1)), 255, dtype=np.uint8
+    )
+    for i, cell in enumerate(cells):
+        stack[i, : cell.shape[0], : cell.shape[1]] = cell
+    ink = stack < threshold
+    area = ink.sum(axis=(1, 2))
+    has_ink = area > 0
+
+    rows_with_ink = ink.any(axis=2)
+    cols_with_ink = ink.any(axis=1)
+    top = rows_with_ink.argmax(axis=1)
+    bottom = rows_with_ink.shape[1] - rows_with_ink[:, ::-1].argmax(axis=1)
+    left = cols_with_ink.argmax(axis=1)
+    right = cols_with_ink.shape[1] - cols_with_ink[:, ::-1].argmax(axis=1)
+    bbox = np.where(
+        has_ink[:, np.newaxis],
+        np.stack([left, top, right - left, bottom - top], axis=1),
+        -1,
+    )
+
+    index = np.arange(len(cells))
+    edges = np.stack(
+        [
+            rows_with_ink[:, 0],
+            cols_with_ink[index, widths - 1],
+            rows_with_ink[index, heights - 1],
+            cols_with_ink[:, 0],
+        ],
+        axis=1,
+    )
+
+    # a stroke of width w and length l has an area of w*l, and about 2*l outline pixels
+    padded = np.pad(ink, ((0, 0), (1, 1), (1, 1)))
+    interior = (
+        padded[:, 1:-1, 1:-1]
+        & padded[:, :-2, 1:-1]
+        & padded[:, 2:, 1:-1]
+        & padded[:, 1:-1, :-2]
+        & padded[:, 1:-1, 2:]
+    )
+    outline = (ink & ~interior).sum(axis=(1, 2))
+    stroke_width = 2 * area / np.maximum(outline, 1)
+
+    return {
+        "coverage": area / (heights * widths),
+        "bbox": bbox,
+        "edges": edges,
+        "stroke_width": stroke_width,
+    }
+
+
+def qa_report(names, metrics, threshold):
+    """Turn `cell_metrics` into a JSON-able report, by glyph name.
+
+    Parameters
+    ----------
+    names : list of str or None
+        Glyph name of each cell, from the config. Cells without a name are left out.
+    metrics : dict
+        From `cell_metrics`.
+    threshold : int
+        The threshold the metrics were measured with.
+
+    Returns
+    -------
+    dict
+        "blank" and "overfull" list the glyph names under BLANK_COVERAGE or over OVERFULL_COVERAGE,
+        "edge_contact" lists the glyphs whose ink touches an edge of their cell,
+        and "cells" has the metrics of every glyph.
+    """
+    report = {
+        "threshold": threshold,
+        "blank": [],
+        "overfull": [],
+        "edge_contact": [],
+        "cells": {},
+    }
+    for cell, name in enumerate(names):
+        if not name or cell >= len(metrics["coverage"]):
+            continue
+        coverage = float(metrics["coverage"][cell])
+        edges = [
+            edge for edge, touches in zip(EDGES, metrics["edges"][cell]) if touches
+        ]
+        report["cells"][name] = {
+            "cell": cell,
+            "coverage": round(coverage, 5),
+            "bbox": metrics["bbox"][cell].tolist(),
+            "edges": edges,
+            "stroke_width": round(float(metrics["stroke_width"][cell]), 2),
+        }
+        if coverage < BLANK_COVERAGE:
+            report["blank"].append(name)
+        elif coverage > OVERFULL_COVERAGE:
+            report["overfull"].append(name)
+        if edges:
+            report["edge_contact"].append(name)
+    return report
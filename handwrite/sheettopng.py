@@ -2,7 +2,106 @@ import os
 import itertools
 import json
 import cv2
-from packaging.version import Version
+import numpy as np
+
+from handwrite.atlas import glyph_store
+from handwrite.binarize import binarize, trace_threshold
+from handwrite.debug import DebugOverlay, debug_level
+from handwrite.glyphtable import glyph_table
+from handwrite.largescan import (
+    RowStrips,
+    is_jpeg,
+    peak_memory_mb,
+    read_reduced,
+    sheet_size,
+)
+from handwrite.layouts import sheet_layout
+from handwrite.qa import cell_metrics, qa_report
+from handwrite.templates import match_template, template_named
+from handwrite.workers import job_count, ordered_map
+
+# One record per contour, from SHEETtoPNG.analyze_contours.
+# bbox is (left, top, width, height), like cv2.boundingRect.
+# perimeter and vertices are only measured for contours that could be a row,
+# and are NaN and -1 for everything else.
+CONTOUR_DTYPE = np.dtype(
+    [
+        ("index", np.int32),
+        ("area", np.float64),
+        ("perimeter", np.float64),
+        ("bbox", np.int32, (4,)),
+        ("vertices", np.int32),
+    ]
+)
+
+# Rows are found on a copy of the sheet that's scaled down by a power of 2,
+# as far as possible while its longest side stays at least this many pixels.
+DETECTION_SIZE = 1000
+
+# Thresholds to try when the config's threshold_value doesn't find all the rows, after Otsu's.
+# Gray paper in dim photos needs a darker threshold, faint pencil lines need a lighter one.
+THRESHOLD_LADDER = (180, 220, 160, 235, 140, 120, 100)
+
+
+# Glyphs that are saved as a changed copy of their cell, as a list of operations:
+# ("pad", side, resize) trims the padding on one side, so glyphs that span two cells join up,
+# and ("rotate", flip, degrees_ccw) turns directional glyphs.
+# The cartouche middle is stretched from 1px to a whole cell, and trimmed on both sides.
+VARIANTS = {
+    "cartoucheStartTok": [("pad", "right")],
+    "bracketleft": [("pad", "right")],
+    "cartoucheEndTok": [("pad", "left")],
+    "bracketright": [("pad", "left")],
+    "cartoucheMiddleTok": [("pad", "right", True), ("pad", "left", True)],
+    "underscore": [("pad", "right", True), ("pad", "left", True)],
+}
+
+# (flip, degrees_ccw) for each direction, by which way the glyph points on the sheet.
+# Glyphs that face sideways are mirrored instead of turned upside down.
+POINTS_DOWN = {
+    "SE": (False, 45),
+    "E": (False, 90),
+    "NE": (False, 135),
+    "N": (False, 180),
+    "NW": (False, 225),
+    "W": (False, 270),
+    "SW": (False, 315),
+}
+POINTS_UP = {
+    "NW": (False, 45),
+    "W": (False, 90),
+    "SW": (False, 135),
+    "S": (False, 180),
+    "SE": (False, 225),
+    "E": (False, 270),
+    "NE": (False, 315),
+}
+FACES_RIGHT = {
+    "NE": (False, 45),
+    "N": (False, 90),
+    "NW": (True, 315),
+    "W": (True, 0),
+    "SW": (True, 45),
+    "S": (False, 270),
+    "SE": (False, 315),
+}
+DIRECTIONAL = {
+    "niTok": POINTS_DOWN,
+    "akesiTok": POINTS_UP,
+    "pipiTok": POINTS_UP,
+    "kalaTok": FACES_RIGHT,
+    "kijetesantakaluTok": FACES_RIGHT,
+    "soweliTok": FACES_RIGHT,
+    "wasoTok": FACES_RIGHT,
+}
+for glyph, directions in DIRECTIONAL.items():
+    for direction, (flip, degrees_ccw) in directions.items():
+        VARIANTS[glyph + "." + direction] = [("rotate", flip, degrees_ccw)]
+
+
+class RowsNotFound(Exception):
+    pass
+
 
 class SHEETtoPNG:
     """Converter class to convert input sample sheet to character PNGs."""
@@ -27,8 +126,9 @@ class SHEETtoPNG:
         rows : int, default=10
             Number of rows of expected contours. Defaults to 10 based on the default sample.
         """
-        with open(config) as f:
-            threshold_value = json.load(f).get("threshold_value", 200)
+        # a GlyphTable from cli.converters, or a path to a config file
+        config = glyph_table(config)
+        threshold_value = config.threshold_value
         if os.path.isdir(sheet):
             raise IsADirectoryError("Sheet parameter should not be a directory.")
         characters = self.detect_characters(
@@ -40,6 +140,38 @@ class SHEETtoPNG:
             config,
             metadata
         )
+        self.check_cells(characters, characters_dir, config, metadata)
+        if metadata.get("large_scan"):
+            peak = peak_memory_mb()
+            if peak is not None:
+                print(f"Peak memory: {peak:.0f} MB")
+
+    def check_cells(self, characters, characters_dir, config, metadata):
+        """Measure all the cells, and write qa.json, with the empty glyphs from `save_images`.
+
+        PNGtoSVG and SVGtoTTF skip empty glyphs, instead of tracing nothing
+        and getting errors from FontForge for it. Nearly blank ones are only warned about.
+        """
+        names = glyph_table(config).names()
+        threshold = trace_threshold(metadata)
+        report = qa_report(
+            names,
+            cell_metrics([images[0] for images in characters], threshold),
+            threshold,
+        )
+        report["empty"] = metadata.get("empty") or []
+        with open(os.path.join(characters_dir, "qa.json"), "w") as f:
+            json.dump(report, f, indent=4)
+        if report["empty"]:
+            print("Empty, not traced:", " ".join(report["empty"]))
+        nearly_blank = [name for name in report["blank"] if name not in report["empty"]]
+        if nearly_blank:
+            print("Nearly blank, check these:", " ".join(nearly_blank))
+
+    def wait(self):
+        """Wait for debug images that are still being saved in the background."""
+        if getattr(self, "debug_overlay", None) is not None:
+            self.debug_overlay.wait()
 
     def detect_characters(self, characters_dir, sheet_image, threshold_value, metadata, cols=20, rows=9):
         """Detect contours on the input image and filter them to get only characters.
@@ -68,36 +200,136 @@ class SHEETtoPNG:
         """
         # TODO Raise errors and suggest where the problem might be
 
-        # Read the image and convert to grayscale
-        image = cv2.imread(sheet_image)
-        cv2.imwrite(os.path.join(characters_dir, "analysis step 1 - image" + ".png"), image)
-        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-        cv2.imwrite(os.path.join(characters_dir, "analysis step 2 - grayscale" + ".png"), gray)
-
-        # Threshold and filter the image for better contour detection
-        _, thresh = cv2.threshold(gray, threshold_value, 255, 1)
-        cv2.imwrite(os.path.join(characters_dir, "analysis step 3 - threshold" + ".png"), thresh)
-        close_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
-
         pixel = metadata.get("pixel") or False
         if pixel:
             iterations = 0
         else:
             iterations = 2
-        close = cv2.morphologyEx(thresh, cv2.MORPH_CLOSE, close_kernel, iterations=iterations)
 
-        cv2.imwrite(os.path.join(characters_dir, "analysis step 4 - close" + ".png"), close)
+        layout = sheet_layout(metadata.get("sheetversion"))
 
-        # Search for contours.
-        contours, h = cv2.findContours(
-            close, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
-        )
+        # off, summary or full. Only "full" writes the analysis steps.
+        debug = debug_level(metadata)
+        full_debug = debug == "full"
 
-        # for debug imaging
-        from PIL import Image, ImageDraw
-        debug_image = Image.open(sheet_image).convert("RGB")
-        debug_draw = ImageDraw.Draw(debug_image)
-        if pixel:
+        large_scan = metadata.get("large_scan") or False
+        if large_scan:
+            # Huge photos: decode in grayscale, find the rows on a small copy,
+            # and only keep the rows at full resolution. No full size debug images.
+            gray, detection, scale, preview = self.read_large_scan(
+                sheet_image, threshold_value, iterations
+            )
+            sheet_width = sheet_size(sheet_image)[0]
+            preview_scale = scale
+            template = None
+        else:
+            # Read the image, then convert to grayscale and threshold it, once.
+            # Detection, centering and cropping all read slices of `gray` and `thresh`.
+            image = cv2.imread(sheet_image)
+            if full_debug:
+                cv2.imwrite(
+                    os.path.join(characters_dir, "analysis step 1 - image" + ".png"),
+                    image,
+                )
+            gray, thresh = binarize(image, threshold_value)
+            if full_debug:
+                cv2.imwrite(
+                    os.path.join(
+                        characters_dir, "analysis step 2 - grayscale" + ".png"
+                    ),
+                    gray,
+                )
+                cv2.imwrite(
+                    os.path.join(
+                        characters_dir, "analysis step 3 - threshold" + ".png"
+                    ),
+                    thresh,
+                )
+
+            sheet_width = thresh.shape[1]
+            preview = image
+            preview_scale = 1
+
+            # Sheets filled in on a computer are exactly lined up with the template,
+            # so their rows are already known.
+            template = match_template(
+                gray, threshold_value, metadata.get("sheetversion")
+            )
+            if template is None:
+                # Find the rows on a smaller copy of the sheet. Rows are huge, so they're easy to find
+                # at low resolution. Their edges get refined at full resolution later.
+                detection, scale = self.detection_level(thresh, iterations)
+
+        if template is not None:
+            print("Digital template:", template["name"])
+            contours, contour_table = self.template_contours(template)
+            scale = 1
+        else:
+            if full_debug:
+                cv2.imwrite(
+                    os.path.join(characters_dir, "analysis step 4 - close" + ".png"),
+                    detection,
+                )
+
+            # Search for contours, and measure each of them once.
+            contours, contour_table = self.find_contours(detection, scale, sheet_width)
+
+            # Dim photos and faint lines don't give all the rows at the config's threshold.
+            # Instead of making someone edit the config and rerun, try a few more on a small copy.
+            found = len(self.consistent_rows(contour_table))
+            if found < rows:
+                small = preview if large_scan else self.min_pool(gray, scale)
+                ladder_value = self.threshold_ladder(
+                    small, scale, sheet_width, threshold_value, iterations, rows
+                )
+                if ladder_value is not None:
+                    print(
+                        f"Threshold: {ladder_value} (threshold_value {threshold_value} from the config found {found} rows)"
+                    )
+                    threshold_value = ladder_value
+                    metadata["threshold_value"] = ladder_value
+                    if large_scan:
+                        gray, detection, scale, preview = self.read_large_scan(
+                            sheet_image, threshold_value, iterations
+                        )
+                    else:
+                        gray, thresh = binarize(gray, threshold_value)
+                        if full_debug:
+                            cv2.imwrite(
+                                os.path.join(
+                                    characters_dir,
+                                    "analysis step 3 - threshold" + ".png",
+                                ),
+                                thresh,
+                            )
+                        # a dimmed export of a digital template only lines up at its own threshold
+                        template = match_template(
+                            gray, threshold_value, metadata.get("sheetversion")
+                        )
+                        detection, scale = self.detection_level(thresh, iterations)
+                    if template is not None:
+                        print("Digital template:", template["name"])
+                        contours, contour_table = self.template_contours(template)
+                        scale = 1
+                    else:
+                        contours, contour_table = self.find_contours(
+                            detection, scale, sheet_width
+                        )
+                elif np.count_nonzero(contour_table["vertices"] == 4) < rows:
+                    raise RowsNotFound(
+                        f"Found {found} of the {rows} rows, at threshold_value {threshold_value}, at Otsu's threshold, "
+                        f"and at every threshold from {min(THRESHOLD_LADDER)} to {max(THRESHOLD_LADDER)}. "
+                        "Is this a sheet? Check the analysis PNGs."
+                    )
+
+        # for debug imaging. shapes are only recorded here,
+        # and drawn on the image that was already decoded at the end, if the debug level asks for it.
+        debug_draw = DebugOverlay()
+        self.debug_overlay = debug_draw
+        if large_scan:
+            # the preview is as small as the detection image
+            debug_width = 1
+        elif pixel:
             debug_width = 1
         else:
             debug_width = 2 
@@ -110,37 +342,90 @@ class SHEETtoPNG:
         #     if len(contour_pil) > 1:
         #         # print(i)
         #         debug_draw.polygon(contour_pil, outline="blue", width=debug_width) # slow
-        #         # debug_image.save(os.path.join(characters_dir, "analysis PREVIEW" + ".png")) # slower
+        #         # debug_draw.save(preview, os.path.join(characters_dir, "analysis PREVIEW" + ".png"), preview_scale, background=False) # slower
         #         x = 1
 
         # Just reverse sort by area, for debug drawing.
-        contours = sorted(contours, key=cv2.contourArea, reverse=True)
+        contour_table = contour_table[np.argsort(-contour_table["area"], kind="stable")]
         for maybe_row in range(rows*2):
-            if len(contours) > maybe_row:
-                contour_pil = [tuple(point[0]) for point in contours[maybe_row]]
+            if len(contour_table) > maybe_row:
+                contour_pil = [
+                    tuple(point[0])
+                    for point in contours[contour_table["index"][maybe_row]]
+                ]
                 if len(contour_pil) > 1:
                     # print(maybe_row)
                     debug_draw.polygon(contour_pil, outline="blue", width=debug_width)
                     x = 1
-        # debug_image.save(os.path.join(characters_dir, "analysis PREVIEW" + ".png"))
-
-        # Filter contours based on number of sides and then reverse sort by area.
-        contours = sorted(
-            filter(
-                lambda cnt: len(
-                    cv2.approxPolyDP(cnt, 0.01 * cv2.arcLength(cnt, True), True)
+        # debug_draw.save(preview, os.path.join(characters_dir, "analysis PREVIEW" + ".png"), preview_scale, background=False)
+
+        # Filter contours based on number of sides. They're still reverse sorted by area.
+        row_table = contour_table[contour_table["vertices"] == 4]
+
+        # Tilted or skewed photos are registered to the template with one homography,
+        # and warped so they line up with it, like a digital template.
+        # Straight scans are left alone, unless the metadata asks for it.
+        registered = False
+        registration = metadata.get("registration") or "auto"
+        if template is None and registration != "rows":
+            homography, reference = self.register(
+                contours, row_table[0:rows], layout, scale, registration == "homography"
+            )
+            if homography is not None:
+                print("Registered to:", reference["name"])
+                if gray is None:
+                    gray = cv2.imread(sheet_image, cv2.IMREAD_GRAYSCALE)
+                height, width = reference["shape"]
+                gray = cv2.warpPerspective(
+                    gray,
+                    homography,
+                    (width, height),
+                    flags=cv2.INTER_NEAREST if pixel else cv2.INTER_LINEAR,
+                    borderValue=255,
+                )
+                gray, thresh = binarize(gray, threshold_value)
+                if full_debug:
+                    cv2.imwrite(
+                        os.path.join(
+                            characters_dir, "analysis step 4b - registered" + ".png"
+                        ),
+                        gray,
+                    )
+
+                # from here on, it's the digital template
+                template, registered = reference, True
+                contours, row_table = self.template_contours(template)
+                scale, large_scan = 1, False
+                image = preview = gray
+                preview_scale = 1
+                # the shapes drawn so far are on the unregistered sheet
+                debug_draw = self.debug_overlay = DebugOverlay()
+
+        if large_scan:
+            # Keep just the biggest rows at full resolution, with enough margin to refine them,
+            # and let the rest of the sheet go.
+            margin = 2 * scale + 2
+            spans = [
+                (top - margin, top + height + margin)
+                for left, top, width, height in row_table["bbox"][0:rows].tolist()
+            ]
+            if gray is None:
+                gray = cv2.imread(sheet_image, cv2.IMREAD_GRAYSCALE)
+            gray = RowStrips.cut(gray, spans)
+            thresh = gray.map(lambda strip: binarize(strip, threshold_value)[1])
+            image = gray  # for the row debug images
+
+        # Snap the rows found at low resolution to the full resolution lines
+        if scale > 1:
+            for row in range(min(rows, len(row_table))):
+                row_table["bbox"][row] = self.refine_row(
+                    thresh, row_table["bbox"][row].tolist(), 2 * scale + 2, iterations
                 )
-                == 4,
-                contours,
-            ),
-            key=cv2.contourArea,
-            reverse=True,
-        )
 
         # for row in range(rows):
         #     print(contours[row])
 
-# START OF KELLY ZONE
+        # START OF KELLY ZONE
         import math
         def small_rect(contour):
             # find a smaller rect,
@@ -159,21 +444,21 @@ class SHEETtoPNG:
             return left_s, top_s, width_s, height_s
 
         # Draw each row contour on the image
-        for i, contour in enumerate(contours):
+        for i, contour_index in enumerate(row_table["index"]):
             # print(i)
             # Convert the contour to a list of tuples for PIL
-            contour_pil = [tuple(point[0]) for point in contour]
+            contour_pil = [tuple(point[0]) for point in contours[contour_index]]
             # print(contour) # this is fine. actually it looks wrong but the resulting bbox is right
             # Draw the contour
             debug_draw.polygon(contour_pil, outline="red", width=debug_width)
-        # debug_image.save(os.path.join(characters_dir, "analysis PREVIEW" + ".png"))
+        # debug_draw.save(preview, os.path.join(characters_dir, "analysis PREVIEW" + ".png"), preview_scale, background=False)
 
         # output the biggest 9 rows as images, for debug purposes
         row_images = []
         for row in range(rows):
             # print(row)
-            left, top, width, height = cv2.boundingRect(contours[row])
-            # left_s, top_s, width_s, height_s = small_rect(contours[row])
+            left, top, width, height = row_table["bbox"][row].tolist()
+            # left_s, top_s, width_s, height_s = small_rect(contours[row_table["index"][row]])
 
             roi = image[
                 top : top  + height,
@@ -190,7 +475,7 @@ class SHEETtoPNG:
 
             debug_draw.rectangle([left, top, left+width, top+height], outline="lime")
             # debug_draw.rectangle([left_s, top_s, left_s+width_s, top_s+height_s], outline="blue")
-            # debug_image.save(os.path.join(characters_dir, "analysis PREVIEW" + ".png"))
+            # debug_draw.save(preview, os.path.join(characters_dir, "analysis PREVIEW" + ".png"), preview_scale, background=False)
 
         row_images.sort(key=lambda x: x[2])
 
@@ -198,58 +483,41 @@ class SHEETtoPNG:
         row_dir = os.path.join(characters_dir)
         if not os.path.exists(row_dir):
             os.mkdir(row_dir)
-        for row in range(rows):
-            cv2.imwrite(os.path.join(row_dir, "analysis step 5 - row" + str(row+1) + ".png"), row_images[row][0])
+        if full_debug:
+            for row in range(rows):
+                cv2.imwrite(
+                    os.path.join(
+                        row_dir, "analysis step 5 - row" + str(row + 1) + ".png"
+                    ),
+                    row_images[row][0],
+                )
 
         # sort the biggest 9 rows, top-to-bottom
-        contours[0:9] = sorted(contours[0:9], key=lambda cnt: cv2.boundingRect(cnt)[1])
+        row_table[0:rows] = row_table[0:rows][
+            np.argsort(row_table["bbox"][0:rows, 1], kind="stable")
+        ]
 
         # Since amongst all the contours, the expected case is that the 4 sided contours
         # containing the characters should have the maximum area, so we loop through the first
         # rows*colums contours and add them to final list after cropping.
-        characters = []
-        for row in range(rows):
+        # grid units of this sheet version, from layouts.py
+        grid_row_w = layout["grid_row_w"]
+        grid_row_h = layout["grid_row_h"]
+        grid_hor_padding = layout["grid_hor_padding"]
+        grid_ver_padding = layout["grid_ver_padding"]
+        grid_scan_w = layout["grid_scan_w"]
+        grid_scan_h = layout["grid_scan_h"]
+        grid_scan_hor_padding = layout["grid_scan_hor_padding"]
+
+        def row_grid(row):
             # Calculate the bounding of the contour and approximate the height
             # and width for final cropping.
-            row_x, row_y, row_w, row_h = cv2.boundingRect(contours[row])
+            row_x, row_y, row_w, row_h = row_table["bbox"][row].tolist()
             # print(row_x, row_y, row_w, row_h)
-            # row_x, row_y, row_w, row_h = small_rect(contours[row]) # doesn't help
-
-            sheet_version = metadata.get("sheetversion") or "99999999.999999.999999"
-            if Version(sheet_version) < Version("3"):
-                # SHEET VERSION 2:
-                # The grid unit here is roughly 0.125cm on the printed page, or 0.25cm in the original huge file.
-                # Each row bounding box (black line) is 164*12, 
-                grid_row_w = 164
-                grid_row_h = 12
-                # with 2 hor padding and 1 ver padding on each side.
-                grid_hor_padding = 2
-                grid_ver_padding = 1
-                # There are 20 glyphs per row. Each glyph scan area is 8x10.
-                grid_scan_w = 8
-                grid_scan_h = 10
-                # The visible gray squares are 7x7, to help with human and scanning errors.
-                grid_glyph_w = 7
-                grid_scan_hor_padding = 0.5
-            else:
-                # SHEET VERSION 3:
-                # The grid unit here is roughly 1/6cm on the printed page, or 1/3cm in the original huge file.
-                # Each row bounding box (black line) is 126x12,
-                grid_row_w = 126
-                grid_row_h = 12
-                # with 3 hor padding and 2 ver padding on each side.
-                grid_hor_padding = 3
-                grid_ver_padding = 2
-                # There are 20 glyphs per row. Each glyph scan area is 6x8.
-                grid_scan_w = 6
-                grid_scan_h = 8
-                # The visible gray squares are 4x4, to help with human and scanning errors.
-                grid_glyph_w = 4
-                grid_scan_hor_padding = 1
+            # row_x, row_y, row_w, row_h = small_rect(contours[row_table["index"][row]]) # doesn't help
 
             # Convert glyph and padding from grid cells into pixels,
             # using the measured size of each row
-            import math
             glyph_w      =            grid_scan_w      * row_w/grid_row_w
             glyph_h      =            grid_scan_h      * row_h/grid_row_h
             # math.floor ensures that a left-aligned pixel font glyph is
@@ -257,16 +525,37 @@ class SHEETtoPNG:
             left_padding = math.floor(grid_hor_padding * row_w/grid_row_w)
             top_padding  =            grid_ver_padding * row_h/grid_row_h
             # print(glyph_w, glyph_h, left_padding, top_padding)
+            return row_x, row_y, glyph_w, glyph_h, left_padding, top_padding
+
+        def centering(row):
+            # find the center of gravity of all 20 cells in the row at once
+            row_x, row_y, glyph_w, glyph_h, left_padding, top_padding = row_grid(row)
+            return self.row_centroids(
+                thresh,
+                row_y + top_padding,
+                glyph_h,
+                row_x + left_padding,
+                glyph_w,
+                cols,
+            )
+
+        if template is not None and not registered:
+            # the cells are exactly where the template put them, there's nothing to center
+            row_centering = [(np.zeros(cols), None, None)] * rows
+        else:
+            # numpy lets go of the GIL while it adds up each row, so rows are measured on the pool
+            row_centering = ordered_map(centering, range(rows), job_count(metadata))
+
+        characters = []
+        for row in range(rows):
+            row_x, row_y, glyph_w, glyph_h, left_padding, top_padding = row_grid(row)
+            masses, centroids_x, centroids_y = row_centering[row]
 
             prev_x_shift = 0
             for col in range(cols):
                 glyph_top  = row_y + top_padding
                 glyph_left = row_x + left_padding + col*glyph_w
                 # print("row" + str(row) + ", col" + str(col) + ": " + str(glyph_left))
-                roi = image[
-                    int(glyph_top ) : int(glyph_top  + glyph_h),
-                    int(glyph_left) : int(glyph_left + glyph_w)
-                ]
 
                 # funny algorithm to center glyph scan areas while scanning.
                 # this helps if groups of glyphs are uniformly shifted left or right,
@@ -281,14 +570,12 @@ class SHEETtoPNG:
                 new_glyph_left = glyph_left
                 old_glyph_top = glyph_top
                 new_glyph_top = glyph_top
-                gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY)
-                _, thresh = cv2.threshold(gray, threshold_value, 255, 1)
                 # this is where the magic happens
                 # i call it magic because i don't understand it
-                moments = cv2.moments(thresh)
-                if moments['m00'] != 0:
-                    centroid_x = moments['m10']/moments['m00']
-                    centroid_y = moments['m01']/moments['m00']
+                # (the moments themselves are in row_centroids)
+                if masses[col] != 0:
+                    centroid_x = centroids_x[col]
+                    centroid_y = centroids_y[col]
                     x_shift = (centroid_x - glyph_w/2)
                     y_shift = (centroid_y - glyph_h/2)
                     if col != 0:
@@ -328,10 +615,10 @@ class SHEETtoPNG:
                         glyph_left = glyph_left + x_shift
                         x = 1
 
-                    roi = image[
-                        int(glyph_top ) : int(glyph_top  + glyph_h),
-                        int(glyph_left) : int(glyph_left + glyph_w)
-                    ]
+                roi = gray[
+                    int(glyph_top) : int(glyph_top + glyph_h),
+                    int(glyph_left) : int(glyph_left + glyph_w),
+                ]
 
                 characters.append([roi, glyph_left, glyph_top, glyph_w, glyph_h])
                 debug_draw.rectangle([old_glyph_left, old_glyph_top, old_glyph_left+glyph_w, old_glyph_top+glyph_h], 
@@ -341,13 +628,19 @@ class SHEETtoPNG:
                         outline="red", width=debug_width)
                 # # i don't understand the following result, but it scares me...
                 # # why are the first 3 custom boxes treated as not centered?
-                # if centered: 
-                #     debug_draw.rectangle([glyph_left, new_glyph_top, glyph_left+glyph_w, new_glyph_top+glyph_h], 
+                # if centered:
+                #     debug_draw.rectangle([glyph_left, new_glyph_top, glyph_left+glyph_w, new_glyph_top+glyph_h],
                 #         outline="red", fill="red", width=debug_width)
-                # debug_image.save(os.path.join(characters_dir, "analysis PREVIEW" + ".png")) # every glyph
-            # debug_image.save(os.path.join(characters_dir, "analysis PREVIEW" + ".png")) # every row
+                # debug_draw.save(preview, os.path.join(characters_dir, "analysis PREVIEW" + ".png"), preview_scale, background=False) # every glyph
+            # debug_draw.save(preview, os.path.join(characters_dir, "analysis PREVIEW" + ".png"), preview_scale, background=False) # every row
 
-        debug_image.save(os.path.join(characters_dir, "analysis PREVIEW" + ".png")) # after processing
+        if debug != "off":
+            # drawn and encoded in the background, while the cells are saved
+            debug_draw.save(
+                preview,
+                os.path.join(characters_dir, "analysis PREVIEW" + ".png"),
+                preview_scale,
+            )  # after processing
 
         # Now we have the characters but since they are all mixed up we need to position them.
         # Sort characters based on 'y' coordinate and group them by number of rows at a time. Then
@@ -381,14 +674,18 @@ class SHEETtoPNG:
             left_scan_padding  = grid_scan_hor_padding * glyph_w/grid_scan_w
 
         glyph_left = open_cartouche[1] + grid_scan_hor_padding * glyph_w/grid_scan_w
-        roi = image[int(glyph_top ) : int(glyph_top  + glyph_h),
-                    int(glyph_left) : int(glyph_left + glyph_w)]
+        roi = gray[
+            int(glyph_top) : int(glyph_top + glyph_h),
+            int(glyph_left) : int(glyph_left + glyph_w),
+        ]
         sorted_characters[120][0] = roi
         sorted_characters[120][1] = glyph_left
 
         glyph_left = close_cartouche[1] - grid_scan_hor_padding * glyph_w/grid_scan_w
-        roi = image[int(glyph_top ) : int(glyph_top  + glyph_h),
-                    int(glyph_left) : int(glyph_left + glyph_w)]
+        roi = gray[
+            int(glyph_top) : int(glyph_top + glyph_h),
+            int(glyph_left) : int(glyph_left + glyph_w),
+        ]
         sorted_characters[121][0] = roi
         sorted_characters[121][1] = glyph_left
 
@@ -411,8 +708,10 @@ class SHEETtoPNG:
         # for the middle portion of the cartouche, grab the leftmost 1px column
         # of the right cartouche. it'll be automatically stretched to the width
         # of a glyph when it's converted to BMP, then SVG.
-        roi = image[int(glyph_top                  ) : int(glyph_top                   + glyph_h),
-                    int(cartouche_middle_glyph_left) : int(cartouche_middle_glyph_left + 1)]
+        roi = gray[
+            int(glyph_top) : int(glyph_top + glyph_h),
+            int(cartouche_middle_glyph_left) : int(cartouche_middle_glyph_left + 1),
+        ]
         #                                                                    # bug? vv
         sorted_characters.append([roi, cartouche_middle_glyph_left, glyph_top, glyph_w, glyph_h])
 
@@ -498,6 +797,499 @@ class SHEETtoPNG:
 
         return sorted_characters
 
+    def detection_level(self, thresh, iterations):
+        """Make the image that rows are detected on.
+
+        Large sheets are scaled down by a power of 2, as long as the longest side stays
+        at least DETECTION_SIZE pixels, so small sheets and huge photos take about the
+        same time to search. A low resolution pixel is ink if any of the pixels it covers
+        is ink, so thin row lines can't fade away, and small gaps in them get closed.
+        Small sheets are closed at full resolution, like before.
+
+        Parameters
+        ----------
+        thresh : numpy.ndarray
+            The thresholded sheet, from `binarize`.
+        iterations : int
+            Number of times to close small gaps in the lines, at full resolution.
+
+        Returns
+        -------
+        detection : numpy.ndarray
+            Image to search for row contours in.
+        scale : int
+            Multiply coordinates in `detection` by this, to get sheet coordinates.
+        """
+        if max(thresh.shape) < 2 * DETECTION_SIZE:
+            close_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+            return (
+                cv2.morphologyEx(
+                    thresh, cv2.MORPH_CLOSE, close_kernel, iterations=iterations
+                ),
+                1,
+            )
+
+        # halve the sheet until it's small enough. INTER_AREA averages each 2x2 block,
+        # so anything above 0 had some ink in it
+        detection = thresh
+        scale = 1
+        while max(detection.shape) >= 2 * DETECTION_SIZE:
+            detection = cv2.resize(
+                detection,
+                (detection.shape[1] // 2, detection.shape[0] // 2),
+                interpolation=cv2.INTER_AREA,
+            )
+            _, detection = cv2.threshold(detection, 0, 255, cv2.THRESH_BINARY)
+            scale *= 2
+        return detection, scale
+
+    def read_large_scan(self, sheet_image, threshold_value, iterations):
+        """Read a huge sheet for row detection, without keeping more of it than necessary.
+
+        The sheet is decoded in grayscale, never in color. JPEGs are decoded at a reduced
+        size for detection, which is much cheaper, and the full resolution sheet is only
+        decoded once the rows are known. Other formats are decoded at full resolution
+        once, and that's kept around to cut the rows out of.
+
+        Parameters
+        ----------
+        sheet_image : str
+            Path to the sheet file to be converted.
+        threshold_value : int
+            Pixels darker than or equal to this are ink.
+        iterations : int
+            Number of times to close small gaps in the lines, like `detection_level`.
+
+        Returns
+        -------
+        gray : numpy.ndarray or None
+            The full resolution sheet in grayscale, or None if it hasn't been decoded yet.
+        detection : numpy.ndarray
+            Image to search for row contours in.
+        scale : int
+            Multiply coordinates in `detection` by this, to get sheet coordinates.
+        preview : numpy.ndarray
+            The sheet in grayscale, at the size of `detection`, from `min_pool`.
+            For "analysis PREVIEW", and for trying other thresholds.
+        """
+        # same scale detection_level would pick for the whole sheet
+        width, height = sheet_size(sheet_image)
+        scale = 1
+        while max(width, height) // scale >= 2 * DETECTION_SIZE:
+            scale *= 2
+
+        if is_jpeg(sheet_image) and scale > 2:
+            # leave one halving to detection_level, so thin lines that the decoder
+            # averages with the paper around them still count as ink
+            reduced = min(scale // 2, 8)
+            small = read_reduced(sheet_image, reduced)
+            gray = None
+        else:
+            reduced = 1
+            small = gray = cv2.imread(sheet_image, cv2.IMREAD_GRAYSCALE)
+
+        _, ink = binarize(small, threshold_value)
+        detection, detection_scale = self.detection_level(ink, iterations)
+        # the darkest pixel of each block, so thresholding it gives `detection` back
+        preview = self.min_pool(small, detection_scale)
+        return gray, detection, reduced * detection_scale, preview
+
+    def template_contours(self, template):
+        """Row contours and contour records for a digital template, without searching for them.
+
+        Each row is a rectangle with exactly the template's bounding box, so the
+        rest of `detect_characters` can't tell them apart from detected rows.
+
+        Parameters
+        ----------
+        template : dict
+            Entry of TEMPLATES, from `match_template`.
+
+        Returns
+        -------
+        contours : list of numpy.ndarray
+            One 4 point contour per row, like cv2.findContours.
+        contour_table : numpy.ndarray
+            One CONTOUR_DTYPE record per row, like `analyze_contours`.
+        """
+        bbox = np.array(template["rows"], dtype=np.int32)
+        left, top, width, height = bbox.T
+        right, bottom = left + width - 1, top + height - 1
+        corners = np.stack([left, top, left, bottom, right, bottom, right, top], axis=1)
+        contours = list(corners.reshape(-1, 4, 1, 2))
+
+        contour_table = np.zeros(len(bbox), dtype=CONTOUR_DTYPE)
+        contour_table["index"] = np.arange(len(bbox))
+        contour_table["area"] = (width - 1) * (height - 1)
+        contour_table["perimeter"] = 2 * (width - 1) + 2 * (height - 1)
+        contour_table["bbox"] = bbox
+        contour_table["vertices"] = 4
+        return contours, contour_table
+
+    def register(self, contours, row_table, layout, scale, force=False):
+        """Fit a homography from the sheet to its reference template, using the corners of every row.
+
+        The four corners of each row contour are matched to the same corners in the
+        template, and one homography is fit to all of them. Straight sheets don't need
+        it: if no corner is more than half a grid unit away from its row's bounding box,
+        nothing is returned, unless `force` is set.
+
+        Parameters
+        ----------
+        contours : list of numpy.ndarray
+            Contours in sheet coordinates, from cv2.findContours.
+        row_table : numpy.ndarray
+            CONTOUR_DTYPE records of the rows, from `analyze_contours`.
+        layout : dict
+            Layout of the sheet version, from `sheet_layout`.
+        scale : int
+            Scale of the detection image. Corners are only accurate to about this many pixels.
+        force : bool, default=False
+            Register the sheet, even if it's straight.
+
+        Returns
+        -------
+        homography : numpy.ndarray or None
+            3x3 matrix from sheet coordinates to template coordinates.
+        reference : dict or None
+            The reference template, like an entry of TEMPLATES. It's scaled up by a whole
+            number if the sheet is much bigger than the template, to keep the detail.
+        """
+        reference = template_named(layout["reference"])
+        if len(row_table) != len(reference["rows"]):
+            return None, None
+
+        # top to bottom, like the template
+        row_table = row_table[np.argsort(row_table["bbox"][:, 1], kind="stable")]
+        sheet_corners = []
+        deviation = 0
+        for record in row_table:
+            corners = self.row_corners(contours[record["index"]], record["perimeter"])
+            if corners is None:
+                return None, None
+            left, top, width, height = record["bbox"].tolist()
+            right, bottom = left + width - 1, top + height - 1
+            box = np.array([[left, top], [right, top], [right, bottom], [left, bottom]])
+            deviation = max(deviation, np.abs(corners - box).max())
+            sheet_corners.append(corners)
+
+        grid_unit = np.median(row_table["bbox"][:, 3]) / layout["grid_row_h"]
+        if not force and deviation <= max(grid_unit / 2, 2 * scale):
+            return None, None
+
+        zoom = max(1, int(np.median(row_table["bbox"][:, 2]) / reference["rows"][0][2]))
+        reference = {
+            **reference,
+            "shape": (reference["shape"][0] * zoom, reference["shape"][1] * zoom),
+            "rows": [tuple(v * zoom for v in row) for row in reference["rows"]],
+        }
+        template_corners = []
+        for left, top, width, height in reference["rows"]:
+            right, bottom = left + width - 1, top + height - 1
+            template_corners.append(
+                [[left, top], [right, top], [right, bottom], [left, bottom]]
+            )
+
+        homography, _ = cv2.findHomography(
+            np.concatenate(sheet_corners).astype(np.float32),
+            np.concatenate(template_corners).astype(np.float32),
+            cv2.RANSAC,
+            5.0 * zoom,
+        )
+        if homography is None:
+            return None, None
+        return homography, reference
+
+    def row_corners(self, contour, perimeter):
+        """The four corners of a row contour, as top left, top right, bottom right, bottom left.
+
+        Uses the same approximation as `analyze_contours`. Returns None if the contour
+        doesn't have exactly four corners.
+        """
+        quad = cv2.approxPolyDP(contour, 0.01 * perimeter, True).reshape(-1, 2)
+        if len(quad) != 4:
+            return None
+        total, difference = quad.sum(axis=1), quad[:, 0] - quad[:, 1]
+        return quad[
+            [
+                np.argmin(total),
+                np.argmax(difference),
+                np.argmax(total),
+                np.argmin(difference),
+            ]
+        ]
+
+    def refine_row(self, thresh, bbox, margin, iterations):
+        """Snap a row found at low resolution to its lines at full resolution.
+
+        Each edge of the row is searched for in a thin window around it, so only a
+        few thousand pixels per row are processed at full resolution. Inside a window,
+        the widest (or tallest) connected piece of ink is the row's line, and its
+        outer edge is the row's edge, same as cv2.boundingRect of the row contour.
+
+        Parameters
+        ----------
+        thresh : numpy.ndarray
+            The thresholded sheet, from `binarize`.
+        bbox : list of int
+            (left, top, width, height) of the row, scaled up to sheet coordinates.
+        margin : int
+            How far the full resolution edge could be from the scaled up one, in pixels.
+        iterations : int
+            Number of times to close small gaps in the lines, like at full resolution.
+
+        Returns
+        -------
+        list of int
+            The refined (left, top, width, height).
+        """
+        left, top, width, height = bbox
+        right, bottom = left + width, top + height
+        sheet_h, sheet_w = thresh.shape
+        close_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+
+        def line_extent(x0, y0, x1, y1, horizontal):
+            # bounding box of the longest piece of line in this window, in sheet coordinates
+            x0, y0, x1, y1 = max(x0, 0), max(y0, 0), min(x1, sheet_w), min(y1, sheet_h)
+            window = cv2.morphologyEx(
+                thresh[y0:y1, x0:x1],
+                cv2.MORPH_CLOSE,
+                close_kernel,
+                iterations=iterations,
+            )
+            count, _, stats, _ = cv2.connectedComponentsWithStats(
+                window, connectivity=8
+            )
+            if count < 2:
+                return None
+            length = stats[1:, cv2.CC_STAT_WIDTH if horizontal else cv2.CC_STAT_HEIGHT]
+            line_left, line_top, line_w, line_h = stats[
+                1 + np.argmax(length), :4
+            ].tolist()
+            return (
+                x0 + line_left,
+                y0 + line_top,
+                x0 + line_left + line_w,
+                y0 + line_top + line_h,
+            )
+
+        top_line = line_extent(
+            left - margin, top - margin, right + margin, top + margin, True
+        )
+        bottom_line = line_extent(
+            left - margin, bottom - margin, right + margin, bottom + margin, True
+        )
+        left_line = line_extent(
+            left - margin, top - margin, left + margin, bottom + margin, False
+        )
+        right_line = line_extent(
+            right - margin, top - margin, right + margin, bottom + margin, False
+        )
+        if top_line:
+            top = top_line[1]
+        if bottom_line:
+            bottom = bottom_line[3]
+        if left_line:
+            left = left_line[0]
+        if right_line:
+            right = right_line[2]
+        return [left, top, right - left, bottom - top]
+
+    def min_pool(self, gray, factor):
+        """Scale a grayscale sheet down by `factor`, keeping the darkest pixel of each block.
+
+        Thresholding the result is the same as thresholding the sheet first and then
+        scaling it down like `detection_level` does, so it's a cheap stand-in for trying
+        other thresholds.
+        """
+        height, width = gray.shape[0] // factor, gray.shape[1] // factor
+        return (
+            gray[: height * factor, : width * factor]
+            .reshape(height, factor, width, factor)
+            .min(axis=(1, 3))
+        )
+
+    def find_contours(self, detection, scale, sheet_width):
+        """Search `detection` for contours, in sheet coordinates, and measure them."""
+        contours, h = cv2.findContours(
+            detection, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE
+        )
+        contours = [contour * scale for contour in contours]
+        return contours, self.analyze_contours(contours, sheet_width)
+
+    def consistent_rows(self, contour_table):
+        """The 4-sided contours that look like rows of one sheet, biggest first.
+
+        Rows are all about the same size and shape, so a 4-sided contour that's much
+        smaller than the biggest one, or a lot wider or narrower, is something else.
+        """
+        quads = contour_table[contour_table["vertices"] == 4]
+        quads = quads[np.argsort(-quads["area"], kind="stable")]
+        if len(quads) == 0:
+            return quads
+        quads = quads[quads["area"] >= quads["area"][0] / 2]
+        aspects = quads["bbox"][:, 2] / quads["bbox"][:, 3]
+        return quads[np.abs(aspects / np.median(aspects) - 1) < 0.25]
+
+    def threshold_ladder(
+        self, small, scale, sheet_width, threshold_value, iterations, rows
+    ):
+        """Find a threshold that gives all the rows, when the config's threshold_value doesn't.
+
+        Tries Otsu's threshold and then THRESHOLD_LADDER, on a small copy of the sheet,
+        and returns the first one that finds `rows` consistent rows.
+
+        Parameters
+        ----------
+        small : numpy.ndarray
+            The sheet in grayscale, scaled down with `min_pool` to the size rows are detected at.
+        scale : int
+            Multiply coordinates in `small` by this, to get sheet coordinates.
+        sheet_width : int
+            Width of the sheet, in pixels.
+        threshold_value : int
+            The threshold that already failed, which isn't tried again.
+        iterations : int
+            Number of times to close small gaps in the lines, if `small` is full size.
+        rows : int
+            Number of rows the sheet should have.
+
+        Returns
+        -------
+        int or None
+            The first threshold that found all the rows, or None.
+        """
+        otsu, _ = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY + cv2.THRESH_OTSU)
+        tried = {threshold_value}
+        for value in (int(otsu),) + THRESHOLD_LADDER:
+            if value in tried:
+                continue
+            tried.add(value)
+            _, detection = cv2.threshold(small, value, 255, cv2.THRESH_BINARY_INV)
+            if scale == 1:
+                close_kernel = cv2.getStructuringElement(cv2.MORPH_RECT, (3, 3))
+                detection = cv2.morphologyEx(
+                    detection, cv2.MORPH_CLOSE, close_kernel, iterations=iterations
+                )
+            _, contour_table = self.find_contours(detection, scale, sheet_width)
+            if len(self.consistent_rows(contour_table)) >= rows:
+                return value
+        return None
+
+    def analyze_contours(self, contours, sheet_width):
+        """Measure every contour once, into a structured array.
+
+        Area and bounding box are cheap, so they're measured for every contour.
+        A row is a wide, short rectangle, so anything narrower than a quarter of the
+        sheet or less than twice as wide as it is tall can't be a row, and is
+        skipped before the expensive cv2.arcLength and cv2.approxPolyDP.
+        That skips nearly all of the ink specks on a messy photo.
+
+        Parameters
+        ----------
+        contours : tuple of numpy.ndarray
+            Contours from cv2.findContours.
+        sheet_width : int
+            Width of the sheet, in pixels.
+
+        Returns
+        -------
+        contour_table : numpy.ndarray
+            One record per contour, with the fields in CONTOUR_DTYPE,
+            in the same order as `contours`.
+        """
+        contour_table = np.zeros(len(contours), dtype=CONTOUR_DTYPE)
+        contour_table["index"] = np.arange(len(contours))
+        contour_table["area"] = [cv2.contourArea(contour) for contour in contours]
+        contour_table["bbox"] = np.reshape(
+            [cv2.boundingRect(contour) for contour in contours], (-1, 4)
+        )
+        contour_table["perimeter"] = np.nan
+        contour_table["vertices"] = -1
+
+        widths = contour_table["bbox"][:, 2]
+        heights = contour_table["bbox"][:, 3]
+        maybe_rows = np.flatnonzero(
+            (widths >= sheet_width / 4) & (widths >= 2 * heights)
+        )
+        for i in maybe_rows:
+            perimeter = cv2.arcLength(contours[i], True)
+            contour_table["perimeter"][i] = perimeter
+            contour_table["vertices"][i] = len(
+                cv2.approxPolyDP(contours[i], 0.01 * perimeter, True)
+            )
+        return contour_table
+
+    def row_centroids(
+        self, thresh, glyph_top, glyph_h, first_glyph_left, glyph_w, cols
+    ):
+        """Find the center of gravity of every cell in a row, in one pass.
+
+        The cells in a row sit edge to edge, so the moments of every cell can be read off
+        cumulative column and row sums of the row strip, instead of running cv2.moments
+        on each cell.
+
+        Parameters
+        ----------
+        thresh : numpy.ndarray
+            The thresholded sheet from `binarize`, 255 where there's ink.
+        glyph_top : float
+            Top of the scan areas in this row, in pixels.
+        glyph_h : float
+            Height of a scan area, in pixels.
+        first_glyph_left : float
+            Left edge of the first scan area in this row, in pixels.
+        glyph_w : float
+            Width of a scan area, in pixels.
+        cols : int
+            Number of cells in the row.
+
+        Returns
+        -------
+        masses : numpy.ndarray
+            Number of ink pixels in each cell. Zero for blank cells.
+        centroids_x, centroids_y : numpy.ndarray
+            Center of gravity of each cell, relative to the cell's own top left corner,
+            same as m10/m00 and m01/m00 from cv2.moments. NaN for blank cells.
+        """
+        # cell edges, truncated the same way as the per-cell slices
+        lefts = first_glyph_left + np.arange(cols) * glyph_w
+        starts = np.trunc(lefts).astype(np.int64)
+        ends = np.trunc(lefts + glyph_w).astype(np.int64)
+        top = int(glyph_top)
+        bottom = int(glyph_top + glyph_h)
+
+        strip_left = max(int(starts[0]), 0)
+        strip = thresh[top:bottom, strip_left : int(ends[-1])]
+        if strip.size == 0:
+            return np.zeros(cols), np.full(cols, np.nan), np.full(cols, np.nan)
+        ink = (strip != 0).astype(np.int64)
+
+        # cell edges relative to the strip, clipped like a numpy slice would be
+        height, width = ink.shape
+        starts = np.clip(starts - strip_left, 0, width)
+        ends = np.clip(ends - strip_left, 0, width)
+
+        # running totals along x, so each cell is a difference of two lookups
+        column_mass = ink.sum(axis=0)
+        cumulative_mass = np.concatenate(([0], np.cumsum(column_mass)))
+        cumulative_x_mass = np.concatenate(
+            ([0], np.cumsum(np.arange(width) * column_mass))
+        )
+        cumulative_rows = np.concatenate(
+            (np.zeros((height, 1), np.int64), np.cumsum(ink, axis=1)), axis=1
+        )
+
+        masses = cumulative_mass[ends] - cumulative_mass[starts]
+        m10 = cumulative_x_mass[ends] - cumulative_x_mass[starts] - starts * masses
+        row_mass = cumulative_rows[:, ends] - cumulative_rows[:, starts]
+        m01 = (np.arange(height)[:, None] * row_mass).sum(axis=0)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            centroids_x = m10 / masses
+            centroids_y = m01 / masses
+        return masses, centroids_x, centroids_y
+
     def save_images(self, characters, characters_dir, config, metadata):
         """Create directory for each character and save as PNG.
 
@@ -506,6 +1298,15 @@ class SHEETtoPNG:
             characters_dir/ord(character)/ord(character).png  (SINGLE SHEET INPUT)
             characters_dir/sheet_filename/ord(character)/ord(character).png  (MULTIPLE SHEETS INPUT)
 
+        Or with metadata["atlas"], one characters_dir/glyphs.atlas with a cell per character.
+
+        Glyphs that share a cell and its variants, like aliTok and aleTok, are only derived
+        and encoded once. They're listed in metadata["aliases"], {alias: first glyph with that cell},
+        so PNGtoSVG traces them once too.
+
+        Glyphs whose image has no ink are listed in metadata["empty"]. That's the padded or rotated
+        image that gets traced, not the cell, so a glyph turned out of its cell is empty too.
+
         Parameters
         ----------
         characters : list of list
@@ -514,6 +1315,8 @@ class SHEETtoPNG:
             Path to directory to save characters in.
         """
         os.makedirs(characters_dir, exist_ok=True)
+        # a directory per glyph, or one glyphs.atlas file with --atlas
+        store = glyph_store(characters_dir, metadata, new=True)
 
         # Create directory for each character and save the png for the characters
         # Structure (single sheet): UserProvidedDir/ord(character)/ord(character).png
@@ -521,91 +1324,47 @@ class SHEETtoPNG:
             # Kelly note: the script does not support multiple sheets, actually
 
         # Kelly note: `characters` is more like `cells`, since not every cell contains a glyph
+        glyphs = []
+        names = glyph_table(config).names()
         for cellNum, images in enumerate(characters):
+            if cellNum < len(names) and names[cellNum]:
+                glyphs.append((names[cellNum], images[0]))
+
+        # the aliases at the end of detect_characters reuse their source's cell,
+        # so the same cell with the same variants is the same glyph, whatever it's called
+        sources = {}
+        aliases = {}
+        for name, cell in glyphs:
+            source = sources.setdefault((id(cell), tuple(VARIANTS.get(name, ()))), name)
+            if source != name:
+                aliases[name] = source
+        metadata["aliases"] = aliases
+
+        # pad, rotate and encode on the pool, then write one by one, in config order
+        threshold = trace_threshold(metadata)
+
+        def encode(glyph):
+            name, cell = glyph
+            image = np.asarray(self.derive(cell, name, metadata))
+            return store.encode("cell", image), bool((image < threshold).any())
+
+        unique = [(name, cell) for name, cell in glyphs if name not in aliases]
+        encoded = dict(
+            zip(
+                (name for name, _ in unique),
+                ordered_map(encode, unique, job_count(metadata)),
+            )
+        )
+        for name, _ in glyphs:
+            store.put(name, "cell", encoded[aliases.get(name, name)][0])
+        # an alias is the same image as its source, so it's empty if its source is
+        metadata["empty"] = list(
+            dict.fromkeys(
+                name for name, _ in glyphs if not encoded[aliases.get(name, name)][1]
+            )
+        )
 
-            with open(config) as f:
-                glyphList = json.load(f).get("glyphs-fancy", {})
-                curMetadatum = glyphList[cellNum]
-                if len(glyphList) > cellNum:
-                    if 'name' in curMetadatum:
-                        character = os.path.join(characters_dir, curMetadatum['name'])
-                        if not os.path.exists(character):
-                            os.mkdir(character)
-                        # print(character, curMetadatum['name'] + ".png")
-                        cv2.imwrite(
-                            os.path.join(character, curMetadatum['name'] + ".png"),
-                            images[0],
-                        )
-
-        # Trim cartouche characters
-            # We'll have to do the same thing for long pi
-            # and any other character that spans two cells
-        self.pad("right", characters_dir, metadata, "cartoucheStartTok")
-        self.pad("right", characters_dir, metadata, "bracketleft")
-        
-        self.pad("left",  characters_dir, metadata, "cartoucheEndTok")
-        self.pad("left",  characters_dir, metadata, "bracketright")
-
-        self.pad("right", characters_dir, metadata, "cartoucheMiddleTok", True)
-        self.pad("left",  characters_dir, metadata, "cartoucheMiddleTok", True)
-        self.pad("right", characters_dir, metadata, "underscore", True)
-        self.pad("left",  characters_dir, metadata, "underscore", True)
-
-        self.rotate(characters_dir, metadata, False,  45, "niTok.SE")
-        self.rotate(characters_dir, metadata, False,  90, "niTok.E")
-        self.rotate(characters_dir, metadata, False, 135, "niTok.NE")
-        self.rotate(characters_dir, metadata, False, 180, "niTok.N")
-        self.rotate(characters_dir, metadata, False, 225, "niTok.NW")
-        self.rotate(characters_dir, metadata, False, 270, "niTok.W")
-        self.rotate(characters_dir, metadata, False, 315, "niTok.SW")
-
-        self.rotate(characters_dir, metadata, False,  45, "akesiTok.NW")
-        self.rotate(characters_dir, metadata, False,  90, "akesiTok.W")
-        self.rotate(characters_dir, metadata, False, 135, "akesiTok.SW")
-        self.rotate(characters_dir, metadata, False, 180, "akesiTok.S")
-        self.rotate(characters_dir, metadata, False, 225, "akesiTok.SE")
-        self.rotate(characters_dir, metadata, False, 270, "akesiTok.E")
-        self.rotate(characters_dir, metadata, False, 315, "akesiTok.NE")
-
-        self.rotate(characters_dir, metadata, False,  45, "pipiTok.NW")
-        self.rotate(characters_dir, metadata, False,  90, "pipiTok.W")
-        self.rotate(characters_dir, metadata, False, 135, "pipiTok.SW")
-        self.rotate(characters_dir, metadata, False, 180, "pipiTok.S")
-        self.rotate(characters_dir, metadata, False, 225, "pipiTok.SE")
-        self.rotate(characters_dir, metadata, False, 270, "pipiTok.E")
-        self.rotate(characters_dir, metadata, False, 315, "pipiTok.NE")
-
-        self.rotate(characters_dir, metadata, False,  45, "kalaTok.NE")
-        self.rotate(characters_dir, metadata, False,  90, "kalaTok.N")
-        self.rotate(characters_dir, metadata, True,  315, "kalaTok.NW")
-        self.rotate(characters_dir, metadata, True,    0, "kalaTok.W")
-        self.rotate(characters_dir, metadata, True,   45, "kalaTok.SW")
-        self.rotate(characters_dir, metadata, False, 270, "kalaTok.S")
-        self.rotate(characters_dir, metadata, False, 315, "kalaTok.SE")
-
-        self.rotate(characters_dir, metadata, False,  45, "kijetesantakaluTok.NE")
-        self.rotate(characters_dir, metadata, False,  90, "kijetesantakaluTok.N")
-        self.rotate(characters_dir, metadata, True,  315, "kijetesantakaluTok.NW")
-        self.rotate(characters_dir, metadata, True,    0, "kijetesantakaluTok.W")
-        self.rotate(characters_dir, metadata, True,   45, "kijetesantakaluTok.SW")
-        self.rotate(characters_dir, metadata, False, 270, "kijetesantakaluTok.S")
-        self.rotate(characters_dir, metadata, False, 315, "kijetesantakaluTok.SE")
-
-        self.rotate(characters_dir, metadata, False,  45, "soweliTok.NE")
-        self.rotate(characters_dir, metadata, False,  90, "soweliTok.N")
-        self.rotate(characters_dir, metadata, True,  315, "soweliTok.NW")
-        self.rotate(characters_dir, metadata, True,    0, "soweliTok.W")
-        self.rotate(characters_dir, metadata, True,   45, "soweliTok.SW")
-        self.rotate(characters_dir, metadata, False, 270, "soweliTok.S")
-        self.rotate(characters_dir, metadata, False, 315, "soweliTok.SE")
-
-        self.rotate(characters_dir, metadata, False,  45, "wasoTok.NE")
-        self.rotate(characters_dir, metadata, False,  90, "wasoTok.N")
-        self.rotate(characters_dir, metadata, True,  315, "wasoTok.NW")
-        self.rotate(characters_dir, metadata, True,    0, "wasoTok.W")
-        self.rotate(characters_dir, metadata, True,   45, "wasoTok.SW")
-        self.rotate(characters_dir, metadata, False, 270, "wasoTok.S")
-        self.rotate(characters_dir, metadata, False, 315, "wasoTok.SE")
+        store.close()
 
 
 
@@ -614,37 +1373,53 @@ class SHEETtoPNG:
     # █    █  █   █   ▄▀▀█   █   █▄▄█
     # █    ▀▄▄▀   ▀▄  ▀▄▄█   ▀▄  ▀▄▄
     
-    def rotate(self, characters_dir, metadata, flip, degrees_ccw, char_name):
+    def derive(self, cell, char_name, metadata):
+        """Apply the VARIANTS of a glyph to its cell, in memory.
+
+        Parameters
+        ----------
+        cell : numpy.ndarray
+            The grayscale cell, which might be shared with other glyphs, so it isn't changed.
+        char_name : str
+            Glyph name, from the config.
+
+        Returns
+        -------
+        numpy.ndarray
+            The cell to save for that glyph, or `cell` itself if it doesn't have variants.
+        """
+        variants = VARIANTS.get(char_name)
+        if variants is None:
+            return cell
+        from PIL import Image
+
+        char_img = Image.fromarray(cell.copy())
+        for operation, *args in variants:
+            if operation == "pad":
+                char_img = self.pad(char_img, metadata, *args)
+            else:
+                char_img = self.rotate(char_img, *args)
+        return np.asarray(char_img)
+
+    def rotate(self, char_img, flip, degrees_ccw):
         from PIL import Image, ImageDraw
-        char_img = Image.open(characters_dir + "/" + char_name + "/" + char_name + ".png")
         if flip:
             char_img = char_img.transpose(method=Image.Transpose.FLIP_LEFT_RIGHT)
         # bilinear might not be the strat; test with different fonts
-        char_img = char_img.rotate(angle=degrees_ccw, fillcolor=(0xF0, 0xF0, 0xF0, 0xFF), resample=Image.Resampling.BILINEAR)
-        char_img.save(characters_dir + "/" + char_name + "/" + char_name + ".png")
-
-
+        char_img = char_img.rotate(
+            angle=degrees_ccw, fillcolor=0xF0, resample=Image.Resampling.BILINEAR
+        )
+        return char_img
 
-    def pad(self, side, characters_dir, metadata, char_name, resize=False):
+    def pad(self, char_img, metadata, side, resize=False):
         from PIL import Image, ImageDraw
-        char_img = Image.open(characters_dir + "/" + char_name + "/" + char_name + ".png")
 
         # resize the cartouche middle from 1px wide to the standard width (for a given sheet version)
-        sheet_version = metadata.get("sheetversion") or "99999999.999999.999999"
-        if Version(sheet_version) < Version("3"):
-            # SHEET VERSION 2: Each glyph scan area is 8x10.
-            grid_scan_w = 8
-            grid_scan_h = 10
-            # The visible gray squares are 7x7, to help with human and scanning errors.
-            grid_glyph_w = 7
-            grid_scan_hor_padding = 0.5
-        else:
-            # SHEET VERSION 3: Each glyph scan area is 6x8.
-            grid_scan_w = 6
-            grid_scan_h = 8
-            # The visible gray squares are 4x4, to help with human and scanning errors.
-            grid_glyph_w = 4
-            grid_scan_hor_padding = 1
+        layout = sheet_layout(metadata.get("sheetversion"))
+        grid_scan_w = layout["grid_scan_w"]
+        grid_scan_h = layout["grid_scan_h"]
+        grid_glyph_w = layout["grid_glyph_w"]
+        grid_scan_hor_padding = layout["grid_scan_hor_padding"]
         if resize:
             # default bicubic resampling gives us round caps on the cartouche extension
             # which lowers the chance of overlap artifacts, from stacked antialiasing on one pixel
@@ -687,4 +1462,4 @@ class SHEETtoPNG:
                  (right,                                          bottom)),
                 fill="white"
             )
-        char_img.save(characters_dir + "/" + char_name + "/" + char_name + ".png")
\ No newline at end of file
+        return char_img
@@ -5,6 +5,22 @@ import uuid
 import datetime
 
 
+def sibling_module(name):
+    """Import one of handwrite's modules from next to this file.
+
+    FontForge's Python can't import handwrite, but atlas.py and outlinecache.py
+    only need the standard library.
+    """
+    import importlib.util
+
+    spec = importlib.util.spec_from_file_location(
+        name, os.path.join(os.path.dirname(os.path.abspath(__file__)), name + ".py")
+    )
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
 class SVGtoTTF:
     def convert(self, directory, outdir, config, metadata=None, other_words_string=None):
         print("SVGtoTTF")
@@ -31,8 +47,16 @@ class SVGtoTTF:
         import subprocess
         import platform
         from packaging.version import Version
+        from handwrite.layouts import sheet_layout
+        from handwrite.glyphtable import glyph_table
+
         sheet_version = metadata.get("sheetversion") or "99999999.999999.999999"
 
+        # FontForge runs in its own process, and reads the config that was saved last
+        config = glyph_table(config)
+        if config.path is None:
+            config.save(os.path.join(directory, "config.json"))
+
         subprocess.run(
             (
                 ["ffpython"]
@@ -41,13 +65,16 @@ class SVGtoTTF:
             )
             + [
                 os.path.abspath(__file__),
-                config,
+                config.path,
                 directory,
                 outdir,
-                json.dumps(metadata),
+                # svgtottf.py can't import handwrite in FontForge, so the layout comes along with the metadata
+                json.dumps(
+                    {**metadata, "layout": sheet_layout(metadata.get("sheetversion"))}
+                ),
                 str(Version(sheet_version).major),
                 str(Version(sheet_version).minor),
-                str(Version(sheet_version).micro)
+                str(Version(sheet_version).micro),
             ]
         )
 
@@ -70,8 +97,10 @@ class SVGtoTTF:
 
         self.metadata = json.loads(json.dumps(metadata)) or {}
 
-        with open(config) as f:
-            self.config = json.load(f)
+        from handwrite.glyphtable import glyph_table
+
+        table = glyph_table(config)
+        self.config = table.config
 
         filename = (self.metadata.get("filename", None) or self.config["props"].get("filename", None))
         if filename is None:
@@ -112,25 +141,25 @@ feature liga {
         list_of_cartoucheable_glyphs = []
 
         # create ligature lines
-        with open(config) as f:
-            glyphs = json.load(f).get("glyphs-fancy", {})
-            for k in glyphs:
-                if 'ligature' in k:
-                    # create tuples of ligature text, followed by ligature length by tokens
-                    list_of_ligs.append((
-                        "  sub " + k['ligature'] + " by " + k['name'] + ";", 
-                        len(k['ligature'].split(' '))
-                    ))
-                    # # If you make ligatures of the format `p o n a space`, 
-                    # # the spacing is incorrect in every browser on iPhone and iPad, as well as Safari for macOS.
-                    # # (The browser correctly renders the ligature, but incorrectly renders an additional space.)
-                    # # So I just make the space character zero-width instead,
-                    # # which is redundant with `p o n a space` ligatures.
-                    # list_of_ligs.append((
-                    #     "  sub " + k['ligature'] + " space by " + k['name'] + ";", 
-                    #     len(k['ligature'].split(' ')) + 1
-                    # ))
-                    list_of_cartoucheable_glyphs.append(k['name'])
+        for k in table.glyphs:
+            if "ligature" in k:
+                # create tuples of ligature text, followed by ligature length by tokens
+                list_of_ligs.append(
+                    (
+                        "  sub " + k["ligature"] + " by " + k["name"] + ";",
+                        len(k["ligature"].split(" ")),
+                    )
+                )
+                # # If you make ligatures of the format `p o n a space`,
+                # # the spacing is incorrect in every browser on iPhone and iPad, as well as Safari for macOS.
+                # # (The browser correctly renders the ligature, but incorrectly renders an additional space.)
+                # # So I just make the space character zero-width instead,
+                # # which is redundant with `p o n a space` ligatures.
+                # list_of_ligs.append((
+                #     "  sub " + k['ligature'] + " space by " + k['name'] + ";",
+                #     len(k['ligature'].split(' ')) + 1
+                # ))
+                list_of_cartoucheable_glyphs.append(k["name"])
 
         list_of_ligs.append(("  sub comma space by zerowidth;", 2))
         list_of_ligs.append(("  sub space space by ideographicspace;", 2))
@@ -690,6 +719,30 @@ function redrawTextarea(e) {
         # print("      It's fine, the font still works!")
 
         import psMat
+
+        # with --atlas, the SVGs are in glyphs.atlas. FontForge only imports files,
+        # so each one is copied to the same scratch file first.
+        atlas = None
+        if self.metadata.get("atlas"):
+            import tempfile
+
+            atlas_module = sibling_module("atlas")
+            atlas = atlas_module.GlyphAtlas(
+                os.path.join(directory, atlas_module.ATLAS_NAME)
+            )
+            scratch = tempfile.mkdtemp()
+
+        # with --cache, glyphs whose SVG was imported in an earlier run get the same contours back,
+        # without importOutlines and removeOverlap. see outlinecache.py
+        cache = sibling_module("outlinecache").outline_cache(self.metadata)
+
+        # aliases share their source's cell and SVG, see SHEETtoPNG.save_images,
+        # so they get the contours their source was imported with
+        aliases = self.metadata.get("aliases") or {}
+        shared = set(aliases.values())
+        imported = {}
+
+        empty = set(self.metadata.get("empty") or [])
         for glyph_object in self.config["glyphs-fancy"]:
             if 'name' in glyph_object:
                 name = glyph_object['name']
@@ -703,24 +756,52 @@ function redrawTextarea(e) {
                     g = self.font.createChar(-1, name)
                 else:
                     g = self.font.createChar(cp, name)
+                # cells without ink weren't traced, so they stay empty glyphs. see qa.py
+                # they still get the same advances as the rest, below
+                if name in empty:
+                    g.width = 1000
+                    g.vwidth = 1000
+                    continue
+
                 # Get outlines
                 src = "{}/{}.svg".format(name, name)
                 src = directory + os.sep + src
+                outline = imported.get(aliases.get(name))
+                if atlas is not None and outline is None:
+                    src = os.path.join(scratch, "glyph.svg")
+                    with open(src, "wb") as f:
+                        f.write(
+                            atlas.read(name, "svg") if (name, "svg") in atlas else b""
+                        )
+
+                key = None
+                if cache is not None and outline is None and os.path.exists(src):
+                    with open(src, "rb") as f:
+                        key = cache.key(
+                            "importOutlines removeoverlap correctdir, removeOverlap",
+                            f.read(),
+                        )
+                    outline = cache.get(key, "outline")
 
                 # importOutlines() will print FontForge errors for blank glyphs.
                 # Prepend what glyph they refer to.
                 print("", end=("\r" + name.ljust(9, " ") + " - "))
-                g.importOutlines(src, ("removeoverlap", "correctdir"))
-                g.removeOverlap()
-
-                if version_major <3:
-                    # SHEET VERSION 2 metrics, before scaling (BS) up so that the glyph is the full em height
-                    bs_scan_hor_padding = 50
-                    bs_glyph_wh = 700
+                if outline is not None:
+                    self.set_outline(g, outline)
                 else:
-                    # SHEET VERSION 3 metrics, before scaling (BS) up so that the glyph is the full em height
-                    bs_scan_hor_padding = 125
-                    bs_glyph_wh = 500
+                    g.importOutlines(src, ("removeoverlap", "correctdir"))
+                    g.removeOverlap()
+                    if key is not None or name in shared:
+                        outline = self.outline(g)
+                    if key is not None:
+                        cache.put(key, "outline", outline)
+                if name in shared:
+                    imported[name] = outline
+
+                # metrics for this sheet version, before scaling (BS) up so that the glyph is the full em height.
+                # from layouts.py, by way of the metadata
+                bs_scan_hor_padding = self.metadata["layout"]["bs_scan_hor_padding"]
+                bs_glyph_wh = self.metadata["layout"]["bs_glyph_wh"]
 
                 # shift by the left margin. (i'm not actually sure why this is necessary, but it looks wrong without it)
                 # (like, why don't i have to shift it vertically??)
@@ -823,6 +904,9 @@ function redrawTextarea(e) {
 
         # get rid of stray metrics
         print("\r                                                ")
+        if cache is not None:
+            cache.close()
+            print(cache.summary())
 
         # originally 800x1000, minus 50 margin on each side for scanning margin
         # ...though the vertical situation might be more complicated?
@@ -912,7 +996,35 @@ function redrawTextarea(e) {
         sp_end_of_reverse_long_glyph = self.font.createChar(0xf199b)
         sp_end_of_reverse_long_glyph.width = 0
 
+        if atlas is not None:
+            import shutil
 
+            shutil.rmtree(scratch)
+
+    def outline(self, g):
+        """The contours of a glyph, as JSON bytes for the outline cache."""
+        return json.dumps(
+            [
+                [
+                    contour.closed,
+                    [[point.x, point.y, point.on_curve] for point in contour],
+                ]
+                for contour in g.foreground
+            ]
+        ).encode("utf-8")
+
+    def set_outline(self, g, outline):
+        """Replace the contours of a glyph with ones from `outline`."""
+        import fontforge
+
+        layer = fontforge.layer()
+        for closed, points in json.loads(outline):
+            contour = fontforge.contour()
+            for x, y, on_curve in points:
+                contour += fontforge.point(x, y, on_curve)
+            contour.closed = closed
+            layer += contour
+        g.foreground = layer
 
     #                                    ▄               ▄▀▀              ▄         ▄▀▀  ▀  █
     # ▄▀▀█  ▄▀▀▄  █▀▀▄  ▄▀▀▄  █▄▀  ▀▀▄  ▀█▀  ▄▀▀▄       ▀█▀  ▄▀▀▄  █▀▀▄  ▀█▀       ▀█▀  ▀█  █  ▄▀▀▄
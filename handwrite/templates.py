@@ -0,0 +1,126 @@
+import numpy as np
+
+from handwrite.layouts import sheet_layout
+
+# Digital templates, for sheets that were filled in on a computer instead of printed and scanned.
+# Those are pixel-aligned with the template, so their rows are already known,
+# and there's no bent paper to center the cells for.
+#
+# "rows" are the row bounding boxes, as (left, top, width, height) from top to bottom,
+# measured by the regular row detection on digitally filled sheets.
+# "shape" is (height, width), like numpy.
+TEMPLATES = [
+    {
+        "name": "template.png (sheet v3)",
+        "grid": "v3",
+        "shape": (3402, 2495),
+        "rows": [
+            (56, 170, 2382, 227),
+            (56, 510, 2382, 227),
+            (56, 850, 2382, 227),
+            (56, 1190, 2382, 228),
+            (56, 1530, 2382, 228),
+            (56, 1869, 2382, 227),
+            (56, 2209, 2382, 227),
+            (56, 2548, 2382, 228),
+            (56, 2888, 2382, 228),
+        ],
+    },
+    {
+        "name": "sheet v2",
+        "grid": "v2",
+        "shape": (3232, 2495),
+        "rows": [
+            (84, 282, 2327, 173),
+            (84, 594, 2327, 174),
+            (84, 906, 2327, 173),
+            (84, 1216, 2327, 174),
+            (84, 1529, 2327, 174),
+            (84, 1841, 2327, 173),
+            (84, 2153, 2327, 173),
+            (84, 2461, 2327, 174),
+            (84, 2777, 2327, 173),
+        ],
+    },
+    {
+        # same size as v2, but rows 2 and 4 are a pixel different
+        "name": "sheet v2.0.2",
+        "grid": "v2",
+        "shape": (3232, 2495),
+        "rows": [
+            (84, 282, 2327, 173),
+            (84, 595, 2327, 173),
+            (84, 906, 2327, 173),
+            (84, 1216, 2327, 173),
+            (84, 1529, 2327, 174),
+            (84, 1841, 2327, 173),
+            (84, 2153, 2327, 173),
+            (84, 2461, 2327, 174),
+            (84, 2777, 2327, 173),
+        ],
+    },
+]
+
+
+def template_named(name):
+    """Entry of TEMPLATES by its name, like a layout's "reference"."""
+    return [template for template in TEMPLATES if template["name"] == name][0]
+
+
+def edge_points(rows, offset):
+    """Sample points along all four edges of every row, `offset` pixels outside the row.
+
+    A negative `offset` is inside the row. Returns the (ys, xs) to index a sheet with.
+    """
+    ys, xs = [], []
+    for left, top, width, height in rows:
+        right, bottom = left + width - 1, top + height - 1
+        # stay away from the corners, which might be rounded
+        along = np.linspace(left + width / 8, right - width / 8, 8).astype(int)
+        down = np.linspace(top + height / 4, bottom - height / 4, 3).astype(int)
+        ys += [np.full(8, top - offset), np.full(8, bottom + offset), down, down]
+        xs += [along, along, np.full(3, left - offset), np.full(3, right + offset)]
+    return np.concatenate(ys), np.concatenate(xs)
+
+
+def match_template(gray, threshold_value, sheet_version):
+    """Find the digital template a sheet was filled in on, by its size and its row lines.
+
+    Only a couple hundred pixels are read: a sheet matches if its row lines are ink just
+    inside every row, and there's paper just outside. Photos and scans of a printed
+    sheet are never lined up that exactly, so they go through row detection instead.
+
+    Parameters
+    ----------
+    gray : numpy.ndarray
+        The sheet in grayscale.
+    threshold_value : int
+        Pixels darker than or equal to this are ink.
+    sheet_version : str or None
+        The sheet version from the metadata. Only templates with the same grid match.
+
+    Returns
+    -------
+    dict or None
+        The best matching entry of TEMPLATES, or None.
+    """
+    best, best_score = None, 0
+    for template in TEMPLATES:
+        if (
+            template["shape"] != gray.shape
+            or template["grid"] != sheet_layout(sheet_version)["grid"]
+        ):
+            continue
+        rows = template["rows"]
+        if (gray[edge_points(rows, -1)] > threshold_value).any() or (
+            gray[edge_points(rows, 2)] <= threshold_value
+        ).any():
+            continue
+        # templates that are a pixel apart both pass that,
+        # so prefer the one whose edges are exactly where the lines end
+        score = (gray[edge_points(rows, 0)] <= threshold_value).mean() + (
+            gray[edge_points(rows, 1)] > threshold_value
+        ).mean()
+        if score > best_score:
+            best, best_score = template, score
+    return best
@@ -0,0 +1,790 @@
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+import threading
+
+import numpy as np
+
+# Tracers turn binarized glyphs into SVGs that FontForge can import.
+#
+#   potrace  the reference. Runs potrace, in its own process.
+#   opencv   in-process: OpenCV contours of the bitmap, smoothed, and fitted with cubic Béziers.
+#            No process per glyph, and nothing to install besides OpenCV.
+#   pixel    for --pixel: the exact outlines of the drawing's pixels, straight lines only.
+#
+# They all write the same kind of SVG: one path, in tenths of a pixel, with y going up,
+# in a group that flips it back. So FontForge imports them the same way.
+#
+# Each tracer has a `key` for the outline cache, with every setting that changes its SVGs.
+
+
+class PotraceNotFound(Exception):
+    pass
+
+
+def find_potrace():
+    """Path to the potrace binary.
+
+    Raises
+    ------
+    PotraceNotFound
+        Raised if potrace not found in path by shutil.which()
+    """
+    potrace = shutil.which("potrace")
+    if potrace is None:
+        raise PotraceNotFound("Potrace is either not installed or not in path")
+    return potrace
+
+
+def pbm(ink):
+    """A binarized glyph as a binary PBM, potrace's own format: 1 bit per pixel, 1 for ink."""
+    height, width = ink.shape
+    return b"P4\n%d %d\n" % (width, height) + np.packbits(ink, axis=1).tobytes()
+
+
+class PotraceTracer:
+    """Trace glyphs with potrace. potrace is looked up once, the first time a glyph is traced,
+    so a run that gets every SVG from the outline cache doesn't need it.
+
+    Raises
+    ------
+    PotraceNotFound
+        Raised if potrace not found in path by shutil.which()
+    """
+
+    key = "potrace --backend svg"
+
+    def __init__(self):
+        self._potrace = None
+        self.lock = threading.Lock()
+
+    @property
+    def potrace(self):
+        with self.lock:
+            if self._potrace is None:
+                self._potrace = find_potrace()
+        return self._potrace
+
+    def trace(self, inks):
+        """Trace several binarized glyphs with one potrace.
+
+        A single glyph goes to potrace's stdin as a PBM, and the SVG comes back on its stdout.
+        That's one potrace per glyph, which is what you get without --trace-batch.
+        potrace only writes one image per SVG stream, though, so a batch goes through
+        PBM files in a temp directory, and potrace writes an SVG next to each.
+
+        Parameters
+        ----------
+        inks : list of numpy.ndarray
+            True where there's ink, from `PNGtoSVG.ink`.
+
+        Returns
+        -------
+        list of bytes
+            The SVG of each glyph, in the same order.
+        """
+        if len(inks) == 1:
+            return [
+                subprocess.run(
+                    [self.potrace, "-", "--backend", "svg", "--output", "-"],
+                    input=pbm(inks[0]),
+                    stdout=subprocess.PIPE,
+                    check=True,
+                ).stdout
+            ]
+        scratch = tempfile.mkdtemp()
+        try:
+            paths = [os.path.join(scratch, f"{i}.pbm") for i in range(len(inks))]
+            for path, ink in zip(paths, inks):
+                with open(path, "wb") as f:
+                    f.write(pbm(ink))
+            subprocess.run([self.potrace, "--backend", "svg", *paths], check=True)
+            svgs = []
+            for path in paths:
+                with open(path[0:-4] + ".svg", "rb") as f:
+                    svgs.append(f.read())
+            return svgs
+        finally:
+            shutil.rmtree(scratch)
+
+
+class ContourTracer:
+    """Trace glyphs in-process, with OpenCV contours and cubic Béziers.
+
+    Each outline follows the pixel edges around the ink, like potrace's do.
+    It's smoothed a little, to get rid of the stairs. Then it's cut at its corners, and each
+    piece is fitted with as few Béziers as stay within `tolerance` pixels of it.
+    Specks of `turd_size` pixels or less are dropped, like potrace does.
+    """
+
+    def __init__(self, smoothing=1.0, corner_degrees=60, tolerance=0.5, turd_size=2):
+        self.smoothing = smoothing
+        self.corner_degrees = corner_degrees
+        self.tolerance = tolerance
+        self.turd_size = turd_size
+
+    @property
+    def key(self):
+        return (
+            f"opencv contours, smoothing {self.smoothing}, corners {self.corner_degrees},"
+            f" tolerance {self.tolerance}, turd size {self.turd_size}"
+        )
+
+    def trace(self, inks):
+        return [svg_document(self.curves(ink), ink.shape) for ink in inks]
+
+    def curves(self, ink):
+        """The outlines of a glyph, as Béziers.
+
+        Parameters
+        ----------
+        ink : numpy.ndarray
+            True where there's ink.
+
+        Returns
+        -------
+        list of numpy.ndarray
+            One closed outline per contour, each an array of shape (n, 4, 2):
+            n cubic Béziers, their 4 control points, and x, y in pixels, with y going down.
+            Holes go the other way around from the outlines they're in.
+        """
+        import cv2
+
+        # padded, so ink on the border still gets a contour all the way around it
+        padded = np.pad(ink, 1).astype(np.uint8)
+        contours, hierarchy = cv2.findContours(
+            padded, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_NONE
+        )
+        outlines = []
+        for contour, (_, _, _, parent) in zip(
+            contours, hierarchy[0] if contours else []
+        ):
+            # pixel x covers x to x + 1, like in potrace's SVGs, so its center is x + 0.5
+            outline = self.edge(
+                contour[:, 0, :].astype(float) - 1 + 0.5, is_hole=parent != -1
+            )
+            if outline is not None:
+                outlines.append(self.fit(outline))
+        return outlines
+
+    def edge(self, centers, is_hole):
+        """From the centers of the pixels on a contour, to the smoothed edge between ink and paper.
+
+        Returns None for specks. Outlines come out with a positive area (shoelace formula,
+        in pixel coordinates), holes with a negative one.
+        """
+        if len(centers) < 3:
+            # a line of pixels 1 wide has a contour that goes there and back
+            centers = (
+                np.concatenate([centers, centers[::-1]])
+                if len(centers) > 1
+                else centers
+            )
+        if (
+            len(centers) == 1
+            or abs(polygon_area(centers)) + len(centers) / 2 + 1 <= self.turd_size
+        ):
+            # pixel's edges enclose about half a pixel more than their centers, per pixel, plus one
+            return None
+
+        # wrap around, so the smoothing doesn't care where the contour starts
+        if self.smoothing > 0:
+            radius = int(3 * self.smoothing)
+            weights = np.exp(
+                -0.5 * (np.arange(-radius, radius + 1) / self.smoothing) ** 2
+            )
+            weights /= weights.sum()
+            wrapped = (
+                np.concatenate([centers[-radius:], centers, centers[:radius]])
+                if radius
+                else centers
+            )
+            smooth = np.stack(
+                [
+                    np.convolve(wrapped[:, axis], weights, mode="valid")
+                    for axis in (0, 1)
+                ],
+                axis=1,
+            )
+            if len(smooth) != len(centers):
+                smooth = centers
+        else:
+            smooth = centers
+
+        # move out of the ink, along the normal, to the middle of the stairs that the pixel edges make:
+        # half a pixel for horizontal and vertical edges, down to 0.35 at 45 degrees
+        tangent = np.roll(smooth, -1, axis=0) - np.roll(smooth, 1, axis=0)
+        length = np.hypot(tangent[:, 0], tangent[:, 1])
+        length[length == 0] = 1
+        normal = (
+            np.stack([tangent[:, 1], -tangent[:, 0]], axis=1) / length[:, np.newaxis]
+        )
+        distance = 0.5 * np.abs(normal).max(axis=1, keepdims=True)
+        outward = 1 if polygon_area(smooth) > 0 else -1
+        edge = smooth + (-1 if is_hole else 1) * outward * distance * normal
+
+        if (polygon_area(edge) < 0) != is_hole:
+            edge = edge[::-1]
+        return edge
+
+    def fit(self, points):
+        """Fit a closed outline with cubic Béziers, cut at its corners."""
+        n = len(points)
+        # turning angle at each point, over a few points either side
+        span = max(2, min(4, n // 6))
+        before = points - np.roll(points, span, axis=0)
+        after = np.roll(points, -span, axis=0) - points
+        turning = np.degrees(
+            np.abs(
+                np.arctan2(
+                    before[:, 0] * after[:, 1] - before[:, 1] * after[:, 0],
+                    (before * after).sum(axis=1),
+                )
+            )
+        )
+        is_corner = (
+            (turning >= self.corner_degrees)
+            & (turning >= np.roll(turning, 1))
+            & (turning > np.roll(turning, -1))
+        )
+        corners = set(np.flatnonzero(is_corner).tolist())
+        # cut smooth stretches too, so every piece has two different ends, and isn't too long to fit
+        cuts = sorted(
+            corners
+            | set(
+                range(
+                    next(iter(sorted(corners)), 0) % max(n // 4, 1), n, max(n // 4, 1)
+                )
+            )
+        )
+        cuts = [
+            cut
+            for cut in cuts
+            if cut in corners or all(abs(cut - corner) > span for corner in corners)
+        ]
+
+        def at(i):
+            return np.take(points, i, axis=0, mode="wrap")
+
+        def tangent(cut, direction):
+            """Unit tangent leaving a cut. Along the side of a corner, past where the smoothing rounded it,
+            or smooth across the cut."""
+            if cut in corners:
+                return unit(at(cut + 2 * direction * span) - at(cut + direction * span))
+            return direction * unit(at(cut + 1) - at(cut - 1))
+
+        # the smoothing rounds corners off, so put them back where their sides meet
+        points = points.copy()
+        for corner in corners:
+            before, after = at(corner - span), at(corner + span)
+            incoming, outgoing = tangent(corner, -1), tangent(corner, 1)
+            determinant = incoming[0] * outgoing[1] - incoming[1] * outgoing[0]
+            if abs(determinant) > 1e-6:
+                # before + s*incoming = after + u*outgoing
+                difference = after - before
+                along = (
+                    difference[0] * outgoing[1] - difference[1] * outgoing[0]
+                ) / determinant
+                meet = before + along * incoming
+                if np.hypot(*(meet - points[corner])) < span:
+                    points[corner] = meet
+
+        curves = []
+        for start, end in zip(cuts, cuts[1:] + [cuts[0] + n]):
+            piece = np.take(points, range(start, end + 1), axis=0, mode="wrap")
+            curves.extend(
+                self.fit_piece(piece, tangent(start, 1), tangent(end % n, -1))
+            )
+        return np.array(curves)
+
+    def fit_piece(self, points, first, last, depth=0):
+        """Schneider's algorithm: fit a Bézier, and split at the worst point until it's close enough."""
+        start, end = points[0], points[-1]
+        chord = np.hypot(*(end - start))
+        if len(points) <= 2 or chord == 0:
+            return [
+                np.array(
+                    [start, start + (end - start) / 3, end - (end - start) / 3, end]
+                )
+            ]
+
+        t = chord_lengths(points)
+        curve = bezier_through(points, t, first, last)
+        error = bezier_error(curve, points, t)
+        if error.max() > self.tolerance and error.max() < 4 * self.tolerance:
+            # move the points' parameters to the closest spot on the curve, and try again
+            t = newton_step(curve, points, t)
+            curve = bezier_through(points, t, first, last)
+            error = bezier_error(curve, points, t)
+        if error.max() <= self.tolerance or depth > 12 or len(points) < 4:
+            return [curve]
+
+        split = int(np.clip(error.argmax(), 1, len(points) - 2))
+        middle = unit(points[split - 1] - points[split + 1])
+        return self.fit_piece(
+            points[: split + 1], first, middle, depth + 1
+        ) + self.fit_piece(points[split:], -middle, last, depth + 1)
+
+
+class PixelTracer:
+    """Trace pixel fonts exactly, as the outlines of their pixels. No curves, and no potrace.
+
+    With --pixel, cells are resized with NEAREST, so each pixel of the drawing becomes a block
+    of trace pixels, give or take one at its edges. `grid` finds the size and offset of those
+    blocks along each axis, and each block is ink if most of it is. The edges between ink and
+    paper are joined into straight runs, so a glyph comes out as a few rectilinear outlines,
+    with every corner on the drawing's grid, and nothing overlapping.
+
+    Glyphs without a grid, like ones that aren't really pixel art, get the outlines of
+    their trace pixels instead. Those are exact too, just not snapped to anything.
+    """
+
+    # blocks smaller than this many trace pixels aren't worth telling apart from jitter
+    min_pitch = 4
+    # how far an edge can be from its grid line, in trace pixels. NEAREST moves edges by up to 1
+    tolerance = 1.5
+
+    @property
+    def key(self):
+        return f"pixel grid, min pitch {self.min_pitch}, tolerance {self.tolerance}"
+
+    def trace(self, inks):
+        return [polygon_document(self.polygons(ink), ink.shape) for ink in inks]
+
+    def polygons(self, ink):
+        """The outlines of a glyph, snapped to its pixel grid.
+
+        Parameters
+        ----------
+        ink : numpy.ndarray
+            True where there's ink.
+
+        Returns
+        -------
+        list of numpy.ndarray
+            One closed outline per contour, each an array of shape (n, 2) of its corners,
+            x, y in trace pixels, with y going down. Outlines have a positive area
+            (shoelace formula), and holes a negative one.
+        """
+        import cv2
+
+        height, width = ink.shape
+        xs = self.grid(edges(ink, axis=1), width)
+        ys = self.grid(edges(ink, axis=0), height)
+        # what share of each block is ink, from the integral image at the block corners
+        columns, rows = np.rint(xs).astype(int), np.rint(ys).astype(int)
+        corners = cv2.integral(ink.view(np.uint8))[np.ix_(rows, columns)]
+        counts = (
+            corners[1:, 1:] - corners[:-1, 1:] - corners[1:, :-1] + corners[:-1, :-1]
+        )
+        areas = np.diff(rows)[:, np.newaxis] * np.diff(columns)[np.newaxis, :]
+        blocks = 2 * counts > areas
+        return [
+            np.stack([xs[loop[:, 0]], ys[loop[:, 1]]], axis=1)
+            for loop in block_outlines(blocks)
+        ]
+
+    def grid(self, positions, length):
+        """Grid lines along one axis: a pitch and offset that every edge in `positions` is close to.
+
+        The biggest pitch that fits wins, since a glyph that only uses every other line of its grid
+        is drawn on a grid twice the size, too. It's refined by least squares, so a glyph with only
+        a couple of edges still gets their exact distance, rather than the nearest pitch that was tried.
+        Without a pitch of at least `min_pitch`, the edges themselves are the grid lines.
+
+        Returns
+        -------
+        numpy.ndarray
+            Increasing positions from 0 to `length`, in trace pixels.
+        """
+        unsnapped = np.unique(np.concatenate([[0, length], positions])).astype(float)
+        # two edges further apart than jitter are a whole number of pitches apart,
+        # so the closest two of those only leave a few pitches to try
+        gaps = np.diff(positions)
+        gaps = gaps[gaps > 2 * self.tolerance]
+        if not len(gaps):
+            return unsnapped
+        gap = gaps.min()
+        pitches = np.concatenate(
+            [
+                np.arange(
+                    (gap + 2 * self.tolerance) / m,
+                    max((gap - 2 * self.tolerance) / m, self.min_pitch),
+                    -0.05,
+                )
+                for m in range(1, int((gap + 2 * self.tolerance) // self.min_pitch) + 1)
+            ]
+            or [[]]
+        )
+        if not len(pitches):
+            return unsnapped
+        pitches = np.sort(pitches)[::-1]
+
+        # the offset that fits best is the mean of the positions, around a circle of the pitch
+        phases = 2 * np.pi * positions[np.newaxis, :] / pitches[:, np.newaxis]
+        offsets = (
+            np.arctan2(np.sin(phases).mean(axis=1), np.cos(phases).mean(axis=1))
+            / (2 * np.pi)
+            * pitches
+        )
+        residuals = (
+            positions[np.newaxis, :]
+            - offsets[:, np.newaxis]
+            + pitches[:, np.newaxis] / 2
+        ) % pitches[:, np.newaxis]
+        worst = np.abs(residuals - pitches[:, np.newaxis] / 2).max(axis=1)
+        # pitches are tried every 0.05, so the right one can be up to 0.025 off, for every pitch along the glyph
+        slack = 0.025 * np.ptp(positions) / pitches
+        for i in np.flatnonzero(worst <= self.tolerance + slack):
+            steps = np.rint((positions - offsets[i]) / pitches[i])
+            pitch, offset = np.polyfit(steps, positions, 1)
+            if (
+                pitch >= self.min_pitch
+                and np.abs(offset + pitch * steps - positions).max() <= self.tolerance
+            ):
+                lines = offset + pitch * np.arange(
+                    np.floor(-offset / pitch), np.ceil((length - offset) / pitch) + 1
+                )
+                return np.unique(
+                    np.clip(np.concatenate([[0, length], lines]), 0, length)
+                )
+        return unsnapped
+
+
+def polygon_area(points):
+    x, y = points[:, 0], points[:, 1]
+    return (np.dot(x, np.roll(y, -1)) - np.dot(np.roll(x, -1), y)) / 2
+
+
+def unit(vector):
+    length = np.hypot(*vector)
+    return vector / length if length else vector
+
+
+def chord_lengths(points):
+    """Parameter of each point along a piece, 0 to 1, by distance along it."""
+    distances = np.concatenate([[0], np.cumsum(np.hypot(*np.diff(points, axis=0).T))])
+    return distances / distances[-1]
+
+
+def bernstein(t):
+    s = 1 - t
+    basis = np.empty((len(t), 4))
+    basis[:, 0] = s * s * s
+    basis[:, 1] = 3 * s * s * t
+    basis[:, 2] = 3 * s * t * t
+    basis[:, 3] = t * t * t
+    return basis
+
+
+def bezier_through(points, t, first, last):
+    """Least squares for how far the control points go along the end tangents, with the ends fixed."""
+    start, end = points[0], points[-1]
+    basis = bernstein(t)
+    b1, b2 = basis[:, 1], basis[:, 2]
+    rest = points - np.outer(basis[:, 0] + b1, start) - np.outer(b2 + basis[:, 3], end)
+    # the tangents are unit vectors, so the 2x2 system only needs dot products
+    c11, c22, c12 = b1 @ b1, b2 @ b2, (b1 @ b2) * (first @ last)
+    x1, x2 = b1 @ (rest @ first), b2 @ (rest @ last)
+    determinant = c11 * c22 - c12 * c12
+    chord = np.hypot(*(end - start))
+    alpha1 = alpha2 = chord / 3
+    if abs(determinant) > 1e-12:
+        alpha1, alpha2 = (x1 * c22 - x2 * c12) / determinant, (
+            c11 * x2 - c12 * x1
+        ) / determinant
+    # negative or tiny handles make loops and cusps, and huge ones overshoot
+    if not (chord * 1e-3 < alpha1 < chord * 2 and chord * 1e-3 < alpha2 < chord * 2):
+        alpha1 = alpha2 = chord / 3
+    return np.array([start, start + alpha1 * first, end + alpha2 * last, end])
+
+
+def bezier_points(curve, t):
+    return bernstein(t) @ curve
+
+
+def bezier_error(curve, points, t):
+    return np.hypot(*(bezier_points(curve, t) - points).T)
+
+
+def newton_step(curve, points, t):
+    """One Newton-Raphson step towards the parameter of the closest point on the curve, for each point."""
+    s = 1 - t
+    d1 = 3 * (
+        np.outer(s ** 2, curve[1] - curve[0])
+        + np.outer(2 * s * t, curve[2] - curve[1])
+        + np.outer(t ** 2, curve[3] - curve[2])
+    )
+    d2 = 6 * (
+        np.outer(s, curve[2] - 2 * curve[1] + curve[0])
+        + np.outer(t, curve[3] - 2 * curve[2] + curve[1])
+    )
+    difference = bezier_points(curve, t) - points
+    numerator = (difference * d1).sum(axis=1)
+    denominator = (d1 * d1).sum(axis=1) + (difference * d2).sum(axis=1)
+    step = np.divide(
+        numerator, denominator, out=np.zeros_like(t), where=np.abs(denominator) > 1e-12
+    )
+    return np.clip(t - step, 0, 1)
+
+
+def edges(ink, axis):
+    """Positions along `axis` where ink starts or stops, in any row or column, counting the borders."""
+    padded = np.pad(ink, [(1, 1) if a == axis else (0, 0) for a in range(2)])
+    changes = np.diff(padded, axis=axis).any(axis=1 - axis)
+    return np.flatnonzero(changes).astype(float)
+
+
+def block_outlines(blocks):
+    """Outlines of the ink in a grid of blocks, as loops of block corners.
+
+    Each edge between ink and paper goes with the ink on its right (y going down), so outlines
+    go clockwise and holes counterclockwise. Where two blocks only touch at a corner, the loop
+    turns towards the ink it's following, so they get separate outlines. Corners that are
+    in the middle of a straight run are left out.
+
+    Returns
+    -------
+    list of numpy.ndarray
+        One array of shape (n, 2) per loop, of (column, row) grid line indexes.
+    """
+    padded = np.pad(blocks, 1)
+    # horizontal edges on grid line r, under block (r - 1, c) and over (r, c)
+    r, c = np.nonzero(padded[:-1, 1:-1] != padded[1:, 1:-1])
+    below = padded[r + 1, c + 1]
+    starts = [
+        (cc + (0 if ink else 1), rr)
+        for rr, cc, ink in zip(r.tolist(), c.tolist(), below.tolist())
+    ]
+    ends = [
+        (cc + (1 if ink else 0), rr)
+        for rr, cc, ink in zip(r.tolist(), c.tolist(), below.tolist())
+    ]
+    # vertical edges on grid line c, right of block (r, c - 1) and left of (r, c)
+    r, c = np.nonzero(padded[1:-1, :-1] != padded[1:-1, 1:])
+    right = padded[r + 1, c + 1]
+    starts += [
+        (cc, rr + (1 if ink else 0))
+        for rr, cc, ink in zip(r.tolist(), c.tolist(), right.tolist())
+    ]
+    ends += [
+        (cc, rr + (0 if ink else 1))
+        for rr, cc, ink in zip(r.tolist(), c.tolist(), right.tolist())
+    ]
+
+    leaving = {}
+    for start, end in zip(starts, ends):
+        leaving.setdefault(start, []).append(end)
+
+    loops = []
+    while leaving:
+        start = next(iter(leaving))
+        loop = [start]
+        point, previous = start, None
+        while True:
+            ends = leaving[point]
+            if len(ends) == 1 or previous is None:
+                end = ends.pop()
+            else:
+                # two blocks touching at a corner: turn right, towards the ink
+                heading = (point[0] - previous[0], point[1] - previous[1])
+                turn = (-heading[1], heading[0])
+                end = next(
+                    (e for e in ends if (e[0] - point[0], e[1] - point[1]) == turn),
+                    ends[0],
+                )
+                ends.remove(end)
+            if not ends:
+                del leaving[point]
+            previous, point = point, end
+            if point == start:
+                break
+            loop.append(point)
+        loops.append(np.array(straighten(loop)))
+    return loops
+
+
+def straighten(loop):
+    """A closed loop of points, without the ones in the middle of straight runs."""
+    kept = []
+    for i, point in enumerate(loop):
+        before, after = loop[i - 1], loop[(i + 1) % len(loop)]
+        if (point[0] - before[0]) * (after[1] - point[1]) != (point[1] - before[1]) * (
+            after[0] - point[0]
+        ):
+            kept.append(point)
+    return kept
+
+
+def svg_document(outlines, shape):
+    """An SVG like potrace writes: one path in tenths of a pixel, y going up, flipped back by its group."""
+    height, width = shape
+    path = []
+    for curves in outlines:
+        # tenths of a pixel, with y going up
+        points = np.rint(
+            np.stack([curves[..., 0] * 10, (height - curves[..., 1]) * 10], axis=-1)
+        ).astype(int)
+        path.append("M%d %d" % tuple(points[0, 0]))
+        path.extend("C%d %d %d %d %d %d" % tuple(curve[1:].ravel()) for curve in points)
+        path.append("z")
+    return svg_file(" ".join(path), shape)
+
+
+def polygon_document(polygons, shape):
+    """Like `svg_document`, for outlines made of straight lines.
+
+    Grid lines are rarely on whole tenths of a pixel, so corners keep three more decimals,
+    and every block of the grid comes out the same size.
+    """
+    height, width = shape
+    path = []
+    for polygon in polygons:
+        points = [
+            "%.7g %.7g" % (round(x * 10, 3), round((height - y) * 10, 3))
+            for x, y in polygon.tolist()
+        ]
+        path.append("M" + points[0])
+        path.extend("L" + point for point in points[1:])
+        path.append("z")
+    return svg_file(" ".join(path), shape)
+
+
+def svg_file(path, shape):
+    height, width = shape
+    return (
+        '<?xml version="1.0" standalone="no"?>\n'
+        '<svg version="1.0" xmlns="http://www.w3.org/2000/svg"\n'
+        f' width="{width}.000000pt" height="{height}.000000pt" viewBox="0 0 {width}.000000 {height}.000000"\n'
+        ' preserveAspectRatio="xMidYMid meet">\n'
+        f'<g transform="translate(0.000000,{height}.000000) scale(0.100000,-0.100000)"\n'
+        'fill="#000000" stroke="none">\n'
+        f'<path d="{path}"/>\n'
+        "</g>\n"
+        "</svg>\n"
+    ).encode("utf-8")
+
+
+TRACERS = {"potrace": PotraceTracer, "opencv": ContourTracer, "pixel": PixelTracer}
+
+
+def tracer_class(metadata):
+    """The tracer class named by metadata["tracer"]. By default, pixel with metadata["pixel"], and potrace otherwise."""
+    name = metadata.get("tracer") or ("pixel" if metadata.get("pixel") else "potrace")
+    if name not in TRACERS:
+        raise ValueError(f"Tracer should be one of {', '.join(TRACERS)}, not {name!r}.")
+    return TRACERS[name]
+
+
+def rescale_svg(svg, shape):
+    """A traced SVG, stretched to the size of a glyph traced at another resolution.
+
+    Only the size and the group's transform change, so it works on potrace's SVGs too.
+
+    Parameters
+    ----------
+    svg : bytes
+        From a tracer.
+    shape : tuple of int
+        (height, width) to stretch it to.
+
+    Returns
+    -------
+    bytes
+        The same outlines, in an SVG that FontForge imports like one traced at `shape`.
+    """
+    height, width = shape
+    traced = re.search(rb'viewBox="0 0 ([\d.]+) ([\d.]+)"', svg)
+    sx, sy = width / float(traced[1]), height / float(traced[2])
+    svg = re.sub(rb'width="[\d.]+pt"', b'width="%d.000000pt"' % width, svg, count=1)
+    svg = re.sub(rb'height="[\d.]+pt"', b'height="%d.000000pt"' % height, svg, count=1)
+    svg = re.sub(
+        rb'viewBox="0 0 [\d.]+ [\d.]+"',
+        b'viewBox="0 0 %d.000000 %d.000000"' % (width, height),
+        svg,
+        count=1,
+    )
+    return re.sub(
+        rb"translate\(([-\d.]+),([-\d.]+)\)\s*scale\(([-\d.]+),([-\d.]+)\)",
+        lambda m: b"translate(%f,%f) scale(%f,%f)"
+        % (
+            float(m[1]) * sx,
+            float(m[2]) * sy,
+            float(m[3]) * sx,
+            float(m[4]) * sy,
+        ),
+        svg,
+        count=1,
+    )
+
+
+def rasterize(svg, shape, supersample=4):
+    """Fill the outlines of a traced SVG back into a bitmap the size of the glyph, for comparing tracers.
+
+    Parameters
+    ----------
+    svg : bytes
+        From a tracer: a path in a group with a translate() scale() transform, like potrace writes.
+    shape : tuple of int
+        (height, width) of the glyph that was traced.
+
+    Returns
+    -------
+    numpy.ndarray
+        True inside the outlines.
+    """
+    import cv2
+    from fontTools.pens.basePen import BasePen
+    from fontTools.pens.transformPen import TransformPen
+    from fontTools.svgLib.path import SVGPath
+
+    polygons = []
+
+    class FlattenPen(BasePen):
+        def _moveTo(self, point):
+            polygons.append([point])
+
+        def _lineTo(self, point):
+            polygons[-1].append(point)
+
+        def _curveToOne(self, p1, p2, p3):
+            curve = np.array([self._getCurrentPoint(), p1, p2, p3])
+            polygons[-1].extend(bezier_points(curve, np.linspace(0, 1, 17)[1:]))
+
+    # fontTools doesn't apply the group's transform, so do that here
+    match = re.search(
+        rb"translate\(([-\d.]+),([-\d.]+)\)\s*scale\(([-\d.]+),([-\d.]+)\)", svg
+    )
+    dx, dy, sx, sy = (
+        (float(value) for value in match.groups()) if match else (0, 0, 1, 1)
+    )
+    pen = TransformPen(
+        FlattenPen(None),
+        (sx * supersample, 0, 0, sy * supersample, dx * supersample, dy * supersample),
+    )
+    SVGPath.fromstring(svg).draw(pen)
+
+    height, width = shape
+    filled = np.zeros((height * supersample, width * supersample), dtype=np.uint8)
+    # fillPoly fills by the even-odd rule, so holes stay empty
+    # and takes pixel centers at whole numbers, where the SVGs have pixel corners
+    polygons = [
+        np.rint((np.array(polygon) - 0.5) * 16).astype(np.int32)
+        for polygon in polygons
+        if len(polygon) > 2
+    ]
+    cv2.fillPoly(filled, polygons, 1, shift=4)
+    return (
+        cv2.resize(
+            filled.astype(np.float32), (width, height), interpolation=cv2.INTER_AREA
+        )
+        >= 0.5
+    )
+
+
+def shape_similarity(a, b):
+    """Intersection over union of two bitmaps: 1 for the same shape, 0 for nothing in common."""
+    union = np.count_nonzero(a | b)
+    return np.count_nonzero(a & b) / union if union else 1.0
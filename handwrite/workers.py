@@ -0,0 +1,35 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+
+def job_count(metadata):
+    """Number of worker threads, from metadata["jobs"], or the number of CPUs.
+
+    Parameters
+    ----------
+    metadata : dict
+        Dictionary containing the metadata. Only "jobs" is used.
+
+    Returns
+    -------
+    int
+        At least 1. With 1, everything runs one after another, like before there were threads.
+    """
+    jobs = metadata.get("jobs") or os.cpu_count() or 1
+    if int(jobs) < 1:
+        raise ValueError(f"jobs should be at least 1, not {jobs!r}.")
+    return int(jobs)
+
+
+def ordered_map(fn, items, jobs):
+    """Like list(map(fn, items)), on `jobs` threads.
+
+    Results come back in the same order as `items`, however the threads finish,
+    so whatever is written from them is written in the same order every time.
+    OpenCV, numpy and PIL let go of the GIL for the heavy parts, so threads are enough.
+    """
+    items = list(items)
+    if jobs == 1 or len(items) < 2:
+        return list(map(fn, items))
+    with ThreadPoolExecutor(max_workers=min(jobs, len(items))) as pool:
+        return list(pool.map(fn, items))
@@ -18,6 +18,7 @@ setuptools.setup(
         "dev": [
             "pre-commit",
             "black",
+            "fonttools",
             "mkdocs==1.2.2",
             "mkdocs-material==6.1.0",
             "pymdown-extensions==8.2",
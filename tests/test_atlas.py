@@ -0,0 +1,87 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from handwrite.atlas import ATLAS_NAME, GlyphAtlas, GlyphDirectory, glyph_store
+
+
+class TestGlyphAtlas(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, ATLAS_NAME)
+        self.cell = np.arange(12 * 7, dtype=np.uint8).reshape(12, 7)
+        self.ink = np.zeros((5, 3), dtype=bool)
+        self.ink[1:4, 1] = True
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_round_trip(self):
+        with GlyphAtlas(self.path, new=True) as atlas:
+            atlas.write("aTok", "cell", self.cell)
+            atlas.write("aTok", "bitmap", self.ink)
+            atlas.write("aTok", "svg", "<svg/>")
+            # readable before it's written out, too
+            np.testing.assert_array_equal(atlas.read("aTok"), self.cell)
+
+        atlas = GlyphAtlas(self.path)
+        self.addCleanup(atlas.close)
+        self.assertEqual(atlas.names(), ["aTok"])
+        np.testing.assert_array_equal(atlas.read("aTok", "cell"), self.cell)
+        np.testing.assert_array_equal(atlas.read("aTok", "bitmap"), self.ink)
+        self.assertEqual(atlas.read("aTok", "svg"), b"<svg/>")
+        self.assertNotIn(("akesiTok", "cell"), atlas)
+
+    def test_later_stages_append(self):
+        with GlyphAtlas(self.path, new=True) as atlas:
+            atlas.write("aTok", "cell", self.cell)
+            atlas.write("akesiTok", "cell", self.cell)
+        with GlyphAtlas(self.path) as atlas:
+            atlas.write("aTok", "svg", b"<svg/>")
+            atlas.write("akesiTok", "cell", 255 - self.cell)
+
+        atlas = GlyphAtlas(self.path)
+        self.assertEqual(atlas.names(), ["aTok", "akesiTok"])
+        self.assertEqual(atlas.names("svg"), ["aTok"])
+        np.testing.assert_array_equal(atlas.read("aTok"), self.cell)
+        np.testing.assert_array_equal(atlas.read("akesiTok"), 255 - self.cell)
+
+        atlas.close()
+
+        # and a new run starts over
+        with GlyphAtlas(self.path, new=True) as atlas:
+            self.assertEqual(atlas.names(), [])
+
+    def test_flush_while_reading(self):
+        with GlyphAtlas(self.path, new=True) as atlas:
+            atlas.write("aTok", "cell", self.cell)
+            atlas.flush()
+            cell = atlas.read("aTok")
+            # the file grows while an array from it is still around
+            atlas.write("akesiTok", "cell", 255 - self.cell)
+            atlas.flush()
+            np.testing.assert_array_equal(cell, self.cell)
+            np.testing.assert_array_equal(atlas.read("akesiTok"), 255 - self.cell)
+            atlas.write("akesiTok", "svg", b"<svg/>")
+        np.testing.assert_array_equal(cell, self.cell)
+        self.assertIsNone(atlas.mmap)
+
+        with GlyphAtlas(self.path) as atlas:
+            self.assertEqual(atlas.names(), ["aTok", "akesiTok"])
+            self.assertEqual(atlas.read("akesiTok", "svg"), b"<svg/>")
+
+    def test_glyph_directory(self):
+        store = glyph_store(self.directory, {})
+        self.assertIsInstance(store, GlyphDirectory)
+        store.write("aTok", "cell", self.cell)
+        store.write("aTok", "bitmap", self.ink)
+        self.assertTrue(
+            os.path.exists(os.path.join(self.directory, "aTok", "aTok.png"))
+        )
+        np.testing.assert_array_equal(store.read("aTok"), self.cell)
+        np.testing.assert_array_equal(store.read("aTok", "bitmap"), self.ink)
+        self.assertEqual(store.names(), ["aTok"])
+        self.assertIsInstance(glyph_store(self.directory, {"atlas": True}), GlyphAtlas)
@@ -0,0 +1,64 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import cv2
+import numpy as np
+
+from handwrite.check import check_sheet
+
+
+class TestCheck(unittest.TestCase):
+    def setUp(self):
+        self.sheets_path = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)),
+            "test_data" + os.sep + "sheettopng",
+        )
+
+    def test_dim_sheet(self):
+        # like a photo taken in dim light, where the paper is darker than threshold_value
+        directory = tempfile.mkdtemp()
+        try:
+            gray = cv2.imread(
+                os.path.join(self.sheets_path, "sitelen-pona-pi-jan-Watesa.png"),
+                cv2.IMREAD_GRAYSCALE,
+            )
+            dim = os.path.join(directory, "dim.png")
+            cv2.imwrite(dim, (gray * 0.6).astype(np.uint8))
+            report = check_sheet(dim)
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(report["rows"], 9)
+        self.assertLess(report["threshold_value"], 153)
+        self.assertEqual(report["errors"], [])
+
+    def test_v2_sheet(self):
+        report = check_sheet(
+            os.path.join(self.sheets_path, "sitelen-pona-pi-jan-Watesa.png")
+        )
+        self.assertEqual(report["rows"], 9)
+        self.assertEqual(report["sheet_version"], "2")
+        self.assertEqual(report["errors"], [])
+        self.assertLess(abs(report["skew"]), 0.5)
+        self.assertNotIn("aTok", report["blank"])
+
+    def test_wrong_sheet_version(self):
+        report = check_sheet(
+            os.path.join(self.sheets_path, "sitelen-pona-pi-jan-Watesa.png"),
+            sheet_version="3.0.4",
+        )
+        self.assertEqual(len(report["errors"]), 1)
+
+    def test_blank_template(self):
+        template = os.path.join(
+            os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "template.png"
+        )
+        report = check_sheet(template)
+        self.assertEqual(report["sheet_version"], "3")
+        self.assertIn("aTok", report["blank"])
+
+    def test_not_a_sheet(self):
+        report = check_sheet(os.path.join(self.sheets_path, "excellent.jpg"))
+        self.assertEqual(report["rows"], 0)
+        self.assertEqual(len(report["errors"]), 1)
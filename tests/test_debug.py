@@ -0,0 +1,45 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from handwrite.debug import DebugOverlay, debug_level
+
+
+class TestDebugOverlay(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.sheet = np.full((40, 60), 255, dtype=np.uint8)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_debug_level(self):
+        self.assertEqual(debug_level({}), "full")
+        self.assertEqual(debug_level({"debug": "off"}), "off")
+        with self.assertRaises(ValueError):
+            debug_level({"debug": "loud"})
+
+    def test_render(self):
+        overlay = DebugOverlay()
+        overlay.rectangle([10, 10, 20, 20], outline="red")
+        overlay.polygon([(30, 4), (50, 4), (50, 16)], outline="blue")
+        self.assertEqual(len(overlay.operations), 2)
+
+        preview = overlay.render(self.sheet)
+        self.assertEqual(preview.size, (60, 40))
+        self.assertEqual(preview.getpixel((10, 15)), (255, 0, 0))
+
+        # at half size, the same shapes land at half the coordinates
+        half = overlay.render(self.sheet[::2, ::2], scale=2)
+        self.assertEqual(half.getpixel((5, 7)), (255, 0, 0))
+
+    def test_save_in_background(self):
+        overlay = DebugOverlay()
+        overlay.rectangle([1, 1, 5, 5], outline="lime")
+        path = os.path.join(self.directory, "analysis PREVIEW.png")
+        overlay.save(self.sheet, path)
+        overlay.wait()
+        self.assertTrue(os.path.exists(path))
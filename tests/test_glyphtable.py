@@ -0,0 +1,60 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from handwrite.glyphtable import GlyphTable, glyph_table
+
+
+class TestGlyphTable(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.config = {
+            "threshold_value": 180,
+            "glyphs-fancy": [
+                {"name": "aTok", "codepoint": "F1900"},
+                {},
+                {"name": "akesiTok", "codepoint": "F1901"},
+                {"name": "alaTok", "codepoint": "F1902", "ligature": "a l a"},
+            ],
+        }
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_lookups(self):
+        table = GlyphTable(self.config)
+        self.assertEqual(len(table), 4)
+        self.assertEqual(table.threshold_value, 180)
+        self.assertEqual(table.names(), ["aTok", None, "akesiTok", "alaTok"])
+        self.assertEqual(table.cell("akesiTok"), 2)
+        self.assertEqual(table.codepoint_cell(0xF1902), 3)
+        self.assertEqual(table.ligature_cell("a l a"), 3)
+        self.assertIsNone(table.cell("kiki"))
+
+    def test_update_and_replace(self):
+        table = GlyphTable(self.config)
+        table.update(3, ligature=None, name="kiki")
+        self.assertIsNone(table.ligature_cell("a l a"))
+        self.assertIsNone(table.cell("alaTok"))
+        self.assertEqual(table.cell("kiki"), 3)
+
+        table.replace(1, {"name": "kiki", "ligature": "k i k i"})
+        # the first cell wins, like a search through the list
+        self.assertEqual(table.cell("kiki"), 1)
+        self.assertEqual(table.ligature_cell("k i k i"), 1)
+        table.update(1, name=None)
+        self.assertEqual(table.cell("kiki"), 3)
+
+    def test_glyph_table(self):
+        path = os.path.join(self.directory, "config.json")
+        with open(path, "w") as f:
+            json.dump(self.config, f)
+        table = glyph_table(path)
+        self.assertEqual(table.path, path)
+        self.assertIs(glyph_table(table), table)
+
+        table.update(0, name="aaa")
+        table.save(path)
+        self.assertEqual(glyph_table(path).cell("aaa"), 0)
@@ -0,0 +1,34 @@
+import unittest
+
+import numpy as np
+
+from handwrite.largescan import RowStrips, peak_memory_mb
+
+
+class TestRowStrips(unittest.TestCase):
+    def setUp(self):
+        self.sheet = np.arange(100 * 30, dtype=np.uint8).reshape(100, 30)
+        self.strips = RowStrips.cut(self.sheet, [(10, 20), (50, 70), (65, 80)])
+
+    def test_slices_match_the_sheet(self):
+        np.testing.assert_array_equal(self.strips[12:18, 3:9], self.sheet[12:18, 3:9])
+        # overlapping spans are merged into one strip
+        np.testing.assert_array_equal(self.strips[60:78, 0:30], self.sheet[60:78, 0:30])
+        self.assertEqual(len(self.strips.strips), 2)
+
+    def test_freed_rows_raise(self):
+        with self.assertRaises(IndexError):
+            self.strips[30:40, 0:5]
+
+    def test_map(self):
+        inverted = self.strips.map(lambda strip: 255 - strip)
+        np.testing.assert_array_equal(
+            inverted[50:55, 1:2], 255 - self.sheet[50:55, 1:2]
+        )
+
+
+class TestPeakMemory(unittest.TestCase):
+    def test_peak_memory(self):
+        peak = peak_memory_mb()
+        if peak is not None:
+            self.assertGreater(peak, 0)
@@ -0,0 +1,20 @@
+import json
+import unittest
+
+from handwrite.layouts import LAYOUTS, sheet_layout
+
+
+class TestLayouts(unittest.TestCase):
+    def test_sheet_layout(self):
+        self.assertEqual(sheet_layout("2.0.2")["trace_size"], (100, 125))
+        self.assertEqual(sheet_layout("2.1")["trace_size"], (200, 250))
+        self.assertEqual(sheet_layout("3.0.4")["grid"], "v3")
+        # latest by default
+        self.assertEqual(sheet_layout(None), LAYOUTS[-1])
+
+    def test_layouts_are_json(self):
+        # svgtottf.py gets the layout through the metadata JSON
+        for layout in LAYOUTS:
+            self.assertEqual(
+                json.loads(json.dumps(layout))["bs_glyph_wh"], layout["bs_glyph_wh"]
+            )
@@ -0,0 +1,47 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from handwrite.outlinecache import OutlineCache, outline_cache
+
+
+class TestOutlineCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_get_and_put(self):
+        cache = OutlineCache(self.directory)
+        key = OutlineCache.key("params", b"pixels")
+        self.assertNotEqual(key, OutlineCache.key("param", b"spixels"))
+        self.assertIsNone(cache.get(key, "svg"))
+        cache.put(key, "svg", b"<svg/>")
+        self.assertEqual(cache.get(key, "svg"), b"<svg/>")
+        self.assertIsNone(cache.get(key, "outline"))
+
+        # a later run finds it too
+        again = OutlineCache(self.directory)
+        self.assertEqual(again.get(key, "svg"), b"<svg/>")
+        self.assertEqual(
+            cache.stats(),
+            {"outline": {"hits": 0, "misses": 1}, "svg": {"hits": 1, "misses": 1}},
+        )
+        self.assertEqual(again.summary(), "Outline cache: svg 1 hits, 0 misses")
+
+    def test_evict_least_recently_used(self):
+        cache = OutlineCache(self.directory, max_bytes=250)
+        for age, key in enumerate(["old", "used", "new"]):
+            cache.put(key, "svg", b"x" * 100)
+            os.utime(cache.path(key, "svg"), (1000 + age, 1000 + age))
+        # reading an entry makes it the most recently used
+        cache.get("used", "svg")
+        cache.close()
+        self.assertEqual(sorted(os.listdir(self.directory)), ["new.svg", "used.svg"])
+
+    def test_outline_cache(self):
+        self.assertIsNone(outline_cache({}))
+        cache = outline_cache({"cache": self.directory, "cache_size": 1})
+        self.assertEqual(cache.max_bytes, 2 ** 20)
@@ -1,7 +1,28 @@
+import io
 import os
+import shutil
+import tempfile
 import unittest
+from unittest import mock
 
-from handwrite.pngtosvg import PNGtoSVG
+import numpy as np
+from PIL import Image
+
+from handwrite.atlas import GlyphDirectory
+from handwrite.binarize import trace_threshold
+from handwrite.glyphtable import GlyphTable
+from handwrite.outlinecache import OutlineCache
+from handwrite.pngtosvg import (
+    PNGtoSVG,
+    PotraceNotFound,
+    batch_size,
+    cache_key,
+    find_potrace,
+    heaviest_first,
+    pbm,
+    trace_size,
+)
+from handwrite.tracers import ContourTracer
 
 
 class TestPNGtoSVG(unittest.TestCase):
@@ -27,3 +48,201 @@ class TestPNGtoSVG(unittest.TestCase):
                     self.assertTrue(os.path.exists(root + os.sep + f[0:-4] + ".svg"))
                     os.remove(root + os.sep + f[0:-4] + ".bmp")
                     os.remove(root + os.sep + f[0:-4] + ".svg")
+
+    def test_ink(self):
+        # same as the per-pixel loop it replaced, for every sheet version, right at the thresholds
+        cell = Image.fromarray(
+            np.random.default_rng(0).integers(0, 256, (200, 150), dtype=np.uint8)
+        )
+        for version in ("2.0.0", "3.0.0", None):
+            for pixel in (False, True):
+                metadata = {"sheetversion": version, "pixel": pixel}
+                ink = self.converter.ink(cell, metadata)
+                threshold = trace_threshold(metadata)
+                width, height = ink.shape[1], ink.shape[0]
+                gray = cell.resize(
+                    (width, height),
+                    resample=Image.Resampling.NEAREST
+                    if pixel
+                    else Image.Resampling.BICUBIC,
+                )
+                expected = [pix < threshold for pix in gray.getdata()]
+                self.assertEqual(ink.dtype, bool)
+                self.assertEqual(ink.ravel().tolist(), expected)
+
+    def test_trace_size(self):
+        # a thick blob, a hairline, and lots of little dots, on a v3 cell
+        blob = np.full((120, 90), 255, dtype=np.uint8)
+        blob[30:90, 20:70] = 0
+        hairline = np.full((120, 90), 255, dtype=np.uint8)
+        hairline[20:100, 44:46] = 0
+        dots = np.full((120, 90), 255, dtype=np.uint8)
+        dots[10:110:8, 10:80:8] = 0
+        metadata = {"sheetversion": "3.0.0", "trace_resolution": "adaptive"}
+        self.assertEqual(trace_size(Image.fromarray(blob), metadata), (144, 192))
+        self.assertEqual(trace_size(Image.fromarray(hairline), metadata), (288, 384))
+        self.assertEqual(trace_size(Image.fromarray(dots), metadata), (288, 384))
+        self.assertEqual(
+            trace_size(Image.fromarray(blob), {"sheetversion": "3.0.0"}), (288, 384)
+        )
+        self.assertEqual(
+            trace_size(Image.fromarray(blob), {**metadata, "pixel": True}), (288, 384)
+        )
+        with self.assertRaises(ValueError):
+            trace_size(Image.fromarray(blob), {"trace_resolution": "huge"})
+
+        # traced at half size, imported at full size
+        ink = self.converter.ink(Image.fromarray(blob), metadata)
+        self.assertEqual(ink.shape, (192, 144))
+        svg = self.converter.trace_all(
+            [ink], ["aTok"], {**metadata, "tracer": "opencv", "jobs": 1}
+        )[0]
+        self.assertIn(b'viewBox="0 0 288.000000 384.000000"', svg)
+
+    def test_adaptive_bitmaps_are_full_size(self):
+        directory = tempfile.mkdtemp()
+        try:
+            store = GlyphDirectory(directory)
+            blob = np.full((120, 90), 255, dtype=np.uint8)
+            blob[30:90, 20:70] = 0
+            store.write("aTok", "cell", blob)
+            metadata = {
+                "sheetversion": "3.0.0",
+                "trace_resolution": "adaptive",
+                "tracer": "opencv",
+            }
+            self.converter.trace_store(store, ["aTok"], metadata, bitmaps=True)
+
+            # traced at half size, but the bitmap lines up with the SVG, at the layout's size
+            bitmap = store.read("aTok", "bitmap")
+            self.assertEqual(bitmap.shape, (384, 288))
+            np.testing.assert_array_equal(
+                bitmap,
+                self.converter.ink(Image.fromarray(blob), {"sheetversion": "3.0.0"}),
+            )
+            self.assertIn(
+                b'viewBox="0 0 288.000000 384.000000"', store.read("aTok", "svg")
+            )
+        finally:
+            shutil.rmtree(directory)
+
+    def test_heaviest_first(self):
+        empty = np.zeros((10, 10), dtype=bool)
+        dot = empty.copy()
+        dot[4:6, 4:6] = True
+        stripes = empty.copy()
+        stripes[::2] = True
+        self.assertEqual(heaviest_first([empty, dot, stripes, dot]), [2, 1, 3, 0])
+
+    def test_pbm(self):
+        # a width that isn't a multiple of 8, so rows are padded
+        ink = np.random.default_rng(0).random((13, 11)) < 0.5
+        image = Image.open(io.BytesIO(pbm(ink)))
+        self.assertEqual(image.mode, "1")
+        # PIL reads PBM ink as black
+        np.testing.assert_array_equal(~np.asarray(image), ink)
+
+    def test_batch_size(self):
+        self.assertEqual(batch_size({}), 1)
+        self.assertEqual(batch_size({"trace_batch": 16}), 16)
+        with self.assertRaises(ValueError):
+            batch_size({"trace_batch": -1})
+
+    def test_find_potrace(self):
+        with mock.patch.dict(os.environ, {"PATH": ""}):
+            with self.assertRaises(PotraceNotFound):
+                find_potrace()
+
+    def test_manifest(self):
+        directory = tempfile.mkdtemp()
+        try:
+            store = GlyphDirectory(directory)
+            cell = np.full((10, 10), 255, dtype=np.uint8)
+            for name in ("aTok", "akesiTok", "alaTok"):
+                store.write(name, "cell", cell)
+            Image.fromarray(cell).save(os.path.join(directory, "analysis PREVIEW.png"))
+            config = GlyphTable(
+                {
+                    "glyphs-fancy": [
+                        {"name": "alaTok"},
+                        {},
+                        {"name": "aTok"},
+                        {"name": "alaTok"},
+                        {"name": "akesiTok"},
+                        {"name": "anuTok"},
+                    ]
+                }
+            )
+
+            # config order, once each, only glyphs with a cell, and nothing empty
+            self.assertEqual(
+                self.converter.manifest(store, config, {"empty": ["akesiTok"]}),
+                ["alaTok", "aTok"],
+            )
+            self.assertEqual(
+                self.converter.manifest(store, None, {}), ["aTok", "akesiTok", "alaTok"]
+            )
+        finally:
+            shutil.rmtree(directory)
+
+    def test_cached_glyphs_arent_traced(self):
+        directory = tempfile.mkdtemp()
+        try:
+            store = GlyphDirectory(os.path.join(directory, "characters"))
+            cell = np.full((10, 10), 255, dtype=np.uint8)
+            cell[3:7, 3:7] = 0
+            store.write("aTok", "cell", cell)
+            metadata = {
+                "cache": os.path.join(directory, "cache"),
+                "sheetversion": "3.0.0",
+                "debug": "off",
+            }
+            OutlineCache(metadata["cache"]).put(
+                cache_key(cell, metadata), "svg", b"<svg/>"
+            )
+            self.assertNotEqual(
+                cache_key(cell, metadata), cache_key(cell, {**metadata, "pixel": True})
+            )
+            # a tracer with other settings doesn't get the default's SVGs
+            self.assertNotEqual(
+                cache_key(cell, metadata, ContourTracer()),
+                cache_key(cell, metadata, ContourTracer(tolerance=1)),
+            )
+
+            # no potrace needed
+            with mock.patch.dict(os.environ, {"PATH": ""}):
+                self.converter.convert(metadata, store.directory)
+            self.assertEqual(store.read("aTok", "svg"), b"<svg/>")
+        finally:
+            shutil.rmtree(directory)
+
+    def test_aliases_are_traced_once(self):
+        directory = tempfile.mkdtemp()
+        try:
+            store = GlyphDirectory(directory)
+            cell = np.full((10, 10), 255, dtype=np.uint8)
+            cell[3:7, 3:7] = 0
+            for name in ("aTok", "a", "aliTok"):
+                store.write(name, "cell", cell)
+            # "aliTok"'s source wasn't saved, so it's traced on its own
+            metadata = {
+                "aliases": {"a": "aTok", "aliTok": "aleTok"},
+                "sheetversion": "3.0.0",
+                "debug": "off",
+            }
+
+            with mock.patch.object(
+                self.converter,
+                "trace_all",
+                side_effect=lambda inks, names, metadata, tracer: [
+                    name.encode() for name in names
+                ],
+            ) as trace_all:
+                self.converter.trace_store(
+                    store, ["aTok", "a", "aliTok"], metadata, bitmaps=False
+                )
+            self.assertEqual(trace_all.call_args.args[1], ["aTok", "aliTok"])
+            self.assertEqual(store.read("a", "svg"), b"aTok")
+            self.assertEqual(store.read("aliTok", "svg"), b"aliTok")
+        finally:
+            shutil.rmtree(directory)
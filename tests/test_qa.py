@@ -0,0 +1,85 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+
+from handwrite.glyphtable import GlyphTable
+from handwrite.qa import cell_metrics, qa_report
+from handwrite.sheettopng import SHEETtoPNG
+
+
+class TestQA(unittest.TestCase):
+    def setUp(self):
+        # a blank cell, a 4px wide bar, a cell that's a pixel smaller with ink on its right edge,
+        # and a dot that's under BLANK_COVERAGE
+        blank = np.full((40, 30), 255, dtype=np.uint8)
+        bar = blank.copy()
+        bar[10:30, 13:17] = 0
+        bleed = np.full((39, 29), 255, dtype=np.uint8)
+        bleed[5:15, 20:29] = 100
+        dot = blank.copy()
+        dot[20, 15] = 0
+        self.cells = [blank, bar, bleed, dot]
+
+    def test_cell_metrics(self):
+        metrics = cell_metrics(self.cells, 127)
+        np.testing.assert_allclose(
+            metrics["coverage"], [0, 80 / 1200, 90 / (39 * 29), 1 / 1200]
+        )
+        self.assertEqual(
+            metrics["bbox"].tolist(),
+            [[-1, -1, -1, -1], [13, 10, 4, 20], [20, 5, 9, 10], [15, 20, 1, 1]],
+        )
+        # top, right, bottom, left
+        self.assertEqual(
+            metrics["edges"].tolist(),
+            [[False] * 4, [False] * 4, [False, True, False, False], [False] * 4],
+        )
+        self.assertAlmostEqual(metrics["stroke_width"][1], 4, delta=1)
+
+    def test_qa_report(self):
+        report = qa_report(
+            ["aTok", None, "akesiTok", "period"], cell_metrics(self.cells, 127), 127
+        )
+        # the dot is only a warning
+        self.assertEqual(report["blank"], ["aTok", "period"])
+        self.assertEqual(report["edge_contact"], ["akesiTok"])
+        self.assertEqual(sorted(report["cells"]), ["aTok", "akesiTok", "period"])
+        self.assertEqual(report["cells"]["akesiTok"]["edges"], ["right"])
+
+    def test_empty_glyphs(self):
+        directory = tempfile.mkdtemp()
+        try:
+            blank = np.full((40, 40), 255, dtype=np.uint8)
+            # ink in a corner, which turning the cell 45 degrees leaves outside it
+            corner = blank.copy()
+            corner[:3, :3] = 0
+            dot = blank.copy()
+            dot[20, 20] = 0
+            names = [
+                "niTok",
+                "akesiTok",
+                "period",
+                "niTok.SE",
+                "akesiTok.NW",
+                "middotTok",
+            ]
+            config = GlyphTable({"glyphs-fancy": [{"name": name} for name in names]})
+            characters = [[blank], [corner], [dot], [blank], [corner], [dot]]
+            metadata = {"sheetversion": "3.0.0", "debug": "off"}
+
+            converter = SHEETtoPNG()
+            converter.save_images(characters, directory, config, metadata)
+            converter.check_cells(characters, directory, config, metadata)
+
+            # empty by the image that's traced: a blank cell's variant too, and a
+            # variant turned out of its cell, but not the dot or its alias
+            self.assertEqual(metadata["empty"], ["niTok", "niTok.SE", "akesiTok.NW"])
+            self.assertEqual(metadata["aliases"], {"middotTok": "period"})
+            with open(os.path.join(directory, "qa.json")) as f:
+                self.assertEqual(json.load(f)["empty"], metadata["empty"])
+        finally:
+            shutil.rmtree(directory)
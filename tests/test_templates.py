@@ -0,0 +1,48 @@
+import os
+import unittest
+
+import cv2
+import numpy as np
+
+from handwrite.templates import match_template
+
+
+class TestTemplates(unittest.TestCase):
+    def setUp(self):
+        self.template = cv2.imread(
+            os.path.join(
+                os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                "template.png",
+            ),
+            cv2.IMREAD_GRAYSCALE,
+        )
+        self.sheets_path = os.path.join(
+            os.path.dirname(os.path.abspath(__file__)),
+            "test_data" + os.sep + "sheettopng",
+        )
+
+    def test_match_template(self):
+        self.assertEqual(
+            match_template(self.template, 200, None)["name"], "template.png (sheet v3)"
+        )
+        # wrong sheet version
+        self.assertIsNone(match_template(self.template, 200, "2.1"))
+
+    def test_match_v2_templates(self):
+        two_squares = cv2.imread(
+            os.path.join(self.sheets_path, "two-squares.png"), cv2.IMREAD_GRAYSCALE
+        )
+        self.assertEqual(
+            match_template(two_squares, 200, "2.0.2")["name"], "sheet v2.0.2"
+        )
+        watesa = cv2.imread(
+            os.path.join(self.sheets_path, "sitelen-pona-pi-jan-Watesa.png"),
+            cv2.IMREAD_GRAYSCALE,
+        )
+        self.assertEqual(match_template(watesa, 200, "2.1")["name"], "sheet v2")
+
+    def test_shifted_sheet_doesnt_match(self):
+        # like a scan that's a few pixels off
+        shifted = np.full_like(self.template, 255)
+        shifted[3:, 2:] = self.template[:-3, :-2]
+        self.assertIsNone(match_template(shifted, 200, None))
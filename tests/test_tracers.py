@@ -0,0 +1,125 @@
+import os
+import shutil
+import unittest
+
+import numpy as np
+from PIL import Image
+
+from handwrite.pngtosvg import PNGtoSVG
+from handwrite.tracers import (
+    ContourTracer,
+    PixelTracer,
+    PotraceTracer,
+    polygon_area,
+    rasterize,
+    rescale_svg,
+    shape_similarity,
+    svg_document,
+    tracer_class,
+)
+
+
+class TestTracers(unittest.TestCase):
+    def setUp(self):
+        # a ring, a square, and a speck that potrace would drop too
+        y, x = np.mgrid[:120, :100]
+        distance = np.hypot(x - 35, y - 40)
+        self.ink = (distance < 28) & (distance > 14)
+        self.ink[80:110, 60:90] = True
+        self.ink[5, 95] = True
+        self.tracer = ContourTracer()
+
+    def test_contour_tracer(self):
+        outlines = self.tracer.curves(self.ink)
+        # ring, its hole, and the square
+        self.assertEqual(len(outlines), 3)
+        traced = rasterize(self.tracer.trace([self.ink])[0], self.ink.shape)
+        self.assertGreater(shape_similarity(traced, self.ink), 0.97)
+        self.assertFalse(traced[40, 35])
+        self.assertFalse(traced[5, 95])
+        # the square keeps its corners
+        self.assertTrue(traced[80, 60] and traced[109, 89])
+
+    def test_rasterize(self):
+        square = np.array(
+            [
+                [[10, 10], [20, 10], [30, 10], [40, 10]],
+                [[40, 10], [40, 20], [40, 30], [40, 40]],
+                [[40, 40], [30, 40], [20, 40], [10, 40]],
+                [[10, 40], [10, 30], [10, 20], [10, 10]],
+            ],
+            dtype=float,
+        )
+        filled = rasterize(svg_document([square], (50, 60)), (50, 60))
+        expected = np.zeros((50, 60), dtype=bool)
+        expected[10:40, 10:40] = True
+        np.testing.assert_array_equal(filled, expected)
+
+    def test_rescale_svg(self):
+        # traced at half size, then stretched back
+        small = self.ink[::2, ::2]
+        svg = rescale_svg(self.tracer.trace([small])[0], self.ink.shape)
+        self.assertIn(b'width="100.000000pt" height="120.000000pt"', svg)
+        self.assertGreater(
+            shape_similarity(rasterize(svg, self.ink.shape), self.ink), 0.9
+        )
+
+    def test_tracer_class(self):
+        self.assertIs(tracer_class({}), PotraceTracer)
+        self.assertIs(tracer_class({"tracer": "opencv"}), ContourTracer)
+        self.assertIs(tracer_class({"pixel": True}), PixelTracer)
+        self.assertIs(tracer_class({"pixel": True, "tracer": "potrace"}), PotraceTracer)
+        with self.assertRaises(ValueError):
+            tracer_class({"tracer": "autotrace"})
+
+    def test_pixel_tracer(self):
+        # an O with a hole, and a pixel that only touches it at a corner,
+        # drawn 5 sheet pixels to a pixel, on a cell that's 8.73 times smaller than the trace size,
+        # so NEAREST makes some of them a trace pixel wider than others
+        art = np.zeros((8, 6), dtype=bool)
+        art[1:6, 1:5] = True
+        art[2:5, 2:4] = False
+        art[6, 5] = True
+        cell = np.full((44, 33), 255, dtype=np.uint8)
+        cell[3:43, 2:32][np.kron(art, np.ones((5, 5), dtype=bool))] = 0
+        ink = PNGtoSVG().ink(
+            Image.fromarray(cell), {"sheetversion": "3.0.0", "pixel": True}
+        )
+
+        tracer = PixelTracer()
+        polygons = tracer.polygons(ink)
+        # the O, its hole, and the pixel on its own
+        self.assertEqual(sorted(len(polygon) for polygon in polygons), [4, 4, 4])
+        self.assertEqual(
+            sorted(np.sign([polygon_area(polygon) for polygon in polygons])), [-1, 1, 1]
+        )
+        # every corner is on the drawing's grid
+        scale = 288 / 33
+        for polygon in polygons:
+            steps = (polygon - [2 * scale, 3 * scale]) / (5 * scale)
+            np.testing.assert_allclose(steps, np.rint(steps), atol=0.01)
+        svg = tracer.trace([ink])[0]
+        self.assertNotIn(b"C", svg)
+        self.assertGreater(shape_similarity(rasterize(svg, ink.shape), ink), 0.97)
+
+    def test_pixel_tracer_without_grid(self):
+        # not pixel art: outlines of the trace pixels themselves
+        ink = np.random.default_rng(0).random((30, 20)) < 0.3
+        np.testing.assert_array_equal(
+            rasterize(PixelTracer().trace([ink])[0], ink.shape), ink
+        )
+
+    @unittest.skipIf(shutil.which("potrace") is None, "potrace isn't installed")
+    def test_close_to_potrace(self):
+        cell = Image.open(
+            os.path.join(
+                os.path.dirname(os.path.abspath(__file__)),
+                "test_data",
+                "pngtosvg",
+                "33.png",
+            )
+        )
+        ink = PNGtoSVG().ink(cell.convert("L"), {"sheetversion": "3.0.0"})
+        potrace = rasterize(PotraceTracer().trace([ink])[0], ink.shape)
+        opencv = rasterize(self.tracer.trace([ink])[0], ink.shape)
+        self.assertGreater(shape_similarity(potrace, opencv), 0.95)
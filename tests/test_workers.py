@@ -0,0 +1,24 @@
+import threading
+import time
+import unittest
+
+from handwrite.workers import job_count, ordered_map
+
+
+class TestWorkers(unittest.TestCase):
+    def test_job_count(self):
+        self.assertEqual(job_count({"jobs": 3}), 3)
+        self.assertGreaterEqual(job_count({}), 1)
+        with self.assertRaises(ValueError):
+            job_count({"jobs": -2})
+
+    def test_ordered_map(self):
+        # later items finish first, but come back in order
+        def slow(item):
+            time.sleep((5 - item) / 1000)
+            return item, threading.get_ident()
+
+        results = ordered_map(slow, range(5), 4)
+        self.assertEqual([item for item, thread in results], [0, 1, 2, 3, 4])
+        serial = ordered_map(slow, range(5), 1)
+        self.assertEqual({thread for item, thread in serial}, {threading.get_ident()})